@@ -1,50 +1,189 @@
 #!/usr/bin/env python3
-import random, argparse
+import random, argparse, os, io, json
+from multiprocessing import Pool
 
 from game import Game
 from humanagent import HumanAgent
-from basicagent import BasicAgent, rig_game
+from basicagent import BasicAgent, rig_game, DEFAULT_MAX_NODES
 from randomagent import RandomAgent
 from gamerunner import GameRunner
+from hiddengame import HiddenGame
+from compactgame import CompactGame
+from searchstats import SlowMoveProfiler, StreamingStats
+from gamelog import GameLogWriter
+from positionbook import PositionBook
+
+AGENT_TYPES = [BasicAgent, RandomAgent]
+
+# position books by path, kept for every game played in this process
+books = {}
+
+def get_book(path):
+    if path not in books:
+        books[path] = PositionBook(path)
+    return books[path]
+
+def play_game(seed, compact=False, agent_args=None, summary_dir=None, slow_move_ms=None, profile_mode='sampling',
+        log=False, book_path=None):
+    '''
+        Play one game dealt from seed, with the global random module (which agents use) seeded with seed too
+        agent_args are keyword arguments for every agent
+        If summary_dir is given, a JSON summary of the game with per-move search stats is written there
+        If slow_move_ms is given, moves slower than that are profiled and kept in the summary with their position
+        Return only a compact summary of the game, so it's cheap to send back from a worker process:
+        (winner, number of turns, [(move time StreamingStats, search stats) per agent], game log record, book entries)
+        The game log record is bytes for a GameLogWriter's file if log is True, otherwise None
+        If book_path is given, agents share the position book there, and the result ends with the
+        entries they added to it (see PositionBook.take_new_entries)
+    '''
+    random.seed(seed)
+    if agent_args is None:
+        agent_args = {}
+    book = None
+    if book_path is not None:
+        book = get_book(book_path)
+        agent_args = dict(agent_args, book=book)
+    agents = [agent(**agent_args) for agent in AGENT_TYPES]
+    game = Game(goal_size=10, seed=seed)
+    #game = rig_game(game, 0)
+    view_type = CompactGame if compact else HiddenGame
+    profiler = None
+    if slow_move_ms is not None:
+        profiler = SlowMoveProfiler(slow_move_ms / 1000, mode=profile_mode)
+    log_writer = GameLogWriter(io.BytesIO()) if log else None
+    runner = GameRunner(game, agents, verbose=False, view_type=view_type,
+            collect_stats=summary_dir is not None, profiler=profiler, log=log_writer)
+    winner = runner.play()
+    if summary_dir is not None and (profiler is None or len(runner.slow_moves) > 0):
+        runner.export_summary(os.path.join(summary_dir, 'game_{}.json'.format(seed)))
+    agent_results = [
+            (times, agent.get_search_stats())
+            for agent, times in zip(agents, runner.agent_move_times)
+        ]
+    log_record = log_writer.f.getvalue() if log else None
+    book_entries = book.take_new_entries() if book is not None else None
+    return (winner, runner.num_turns, agent_results, log_record, book_entries)
+
+def play_game_args(args):
+    seed, kwargs = args
+    return play_game(seed, **kwargs)
 
 def main():
 
-    random.seed(None)
-    
     parser = argparse.ArgumentParser(description="Run batches of games to test agents")
     parser.add_argument('-n', '--num-games', type=int, default=1, dest='num_games', help='number of games')
+    parser.add_argument('--compact', action='store_true', help='show agents the game as a CompactGame')
+    parser.add_argument('-w', '--workers', type=int, default=1, help='number of processes to play games in')
+    parser.add_argument('-s', '--seed', type=int, default=None,
+            help='game i is played with seed + i, so runs with the same seed have the same results')
+    parser.add_argument('--max-move-ms', type=float, default=None, dest='max_move_ms',
+            help='time budget for each move in ms (default and 0 mean no limit) - moves which hit it depend on '
+                'machine load, so runs with the same seed can differ')
+    parser.add_argument('--max-nodes', type=int, default=DEFAULT_MAX_NODES, dest='max_nodes',
+            help='limit on states expanded for each move - unlike the time budget, this keeps runs reproducible')
+    parser.add_argument('--track-beliefs', action='store_true', dest='track_beliefs',
+            help='agents track unseen cards and use them to estimate danger')
+    parser.add_argument('--book', metavar='FILE', help='position book to look up and save paths in')
+    parser.add_argument('--log', metavar='FILE', help='append the games to a binary game log')
+    parser.add_argument('--stats-json', metavar='FILE', dest='stats_json',
+            help='write the results and each agent\'s move time stats to this JSON file at the end of the run')
+    parser.add_argument('--summary-dir', dest='summary_dir',
+            help='write a JSON summary of each game, with per-move search stats, to this directory')
+    parser.add_argument('--slow-move-ms', type=float, dest='slow_move_ms',
+            help='profile moves slower than this, and only write summaries of games with slow moves')
+    parser.add_argument('--profile-mode', choices=['sampling', 'cprofile'], default='sampling', dest='profile_mode',
+            help='how to profile slow moves')
     args = parser.parse_args()
-    agent_types = [BasicAgent, RandomAgent]
-    gamerunners = []
-
-    print('Running',end='',flush=True)
-    for _ in range(args.num_games):
-        agents = [agent() for agent in agent_types]
-        game = Game(goal_size=10)
-        #game = rig_game(game, 0)
-        game = GameRunner(game, agents, verbose=False)
-        winner = game.play()
-        gamerunners.append(game)
-        print('.',end='', flush=True)
+    if args.slow_move_ms is not None and args.summary_dir is None:
+        parser.error('--slow-move-ms needs --summary-dir')
+    if args.summary_dir is not None:
+        os.makedirs(args.summary_dir, exist_ok=True)
+    agent_args = {
+            'max_move_ms': args.max_move_ms if args.max_move_ms else None,
+            'max_nodes': args.max_nodes,
+            'track_beliefs': args.track_beliefs,
+            }
+
+    seed = args.seed
+    if seed is None:
+        seed = random.SystemRandom().randrange(2**32)
+    game_kwargs = {
+            'compact': args.compact,
+            'agent_args': agent_args,
+            'summary_dir': args.summary_dir,
+            'slow_move_ms': args.slow_move_ms,
+            'profile_mode': args.profile_mode,
+            'log': args.log is not None,
+            'book_path': args.book,
+            }
+    game_args = [(seed + i, game_kwargs) for i in range(args.num_games)]
+
+    agent_scores = [0 for _ in AGENT_TYPES]
+    # streamed, so memory doesn't grow with the number of games
+    agent_move_times = [StreamingStats() for _ in AGENT_TYPES]
+    agent_search_stats = [{} for _ in AGENT_TYPES]
+    total_turns = 0
+    num_stalemates = 0
+
+    print('Running (seed {})'.format(seed), end='', flush=True)
+    if args.workers > 1:
+        pool = Pool(args.workers)
+        results = pool.imap_unordered(play_game_args, game_args, chunksize=max(1, len(game_args) // (args.workers * 16)))
+    else:
+        pool = None
+        results = map(play_game_args, game_args)
+
+    log_file = open(args.log, 'ab') if args.log is not None else None
+
+    # only keep running totals, not every game
+    book = get_book(args.book) if args.book is not None else None
+    for winner, num_turns, agent_results, log_record, book_entries in results:
+        if book is not None:
+            book.add_entries(book_entries)
+        if log_file is not None:
+            log_file.write(log_record)
+        if winner is None:
+            num_stalemates += 1
+        else:
+            agent_scores[winner] += 1
+        total_turns += num_turns
+        for agent_id, (move_times, search_stats) in enumerate(agent_results):
+            agent_move_times[agent_id].merge(move_times)
+            for stat, value in search_stats.items():
+                agent_search_stats[agent_id][stat] = agent_search_stats[agent_id].get(stat, 0) + value
+        print('.', end='', flush=True)
     print('')
-    
-    agent_scores = [0, 0]
-    agent_move_times = [[], []]
-    agent_longest_move_time = [0, 0]
-    for game in gamerunners:
-        agent_scores[game.game.winner] += 1
-        longest = game.get_longest_move_times()
-        for agent_id in range(len(agent_types)):
-            agent_move_times[agent_id] += game.agent_move_times[agent_id]
-            if longest[agent_id] > agent_longest_move_time[agent_id]:
-                agent_longest_move_time[agent_id] = longest[agent_id]
+
+    if pool is not None:
+        pool.close()
+        pool.join()
+    if log_file is not None:
+        log_file.close()
+    if book is not None:
+        book.save()
 
     print('Scores:')
-    for i, agent_type, agent_score in zip(range(len(agent_types)), agent_types, agent_scores):
+    agent_summaries = []
+    for i, agent_type, agent_score in zip(range(len(AGENT_TYPES)), AGENT_TYPES, agent_scores):
         agent = agent_type()
+        move_times = agent_move_times[i].summary()
         print('  {} - {}: {}'.format(i, agent.name, agent_score))
-        print('    avg move time: {}'.format(sum(agent_move_times[i])/len(agent_move_times[i])))
-        print('    longest move time: {}'.format(agent_longest_move_time[i]))
+        print('    avg move time: {}'.format(move_times['mean']))
+        print('    longest move time: {}'.format(move_times['max']))
+        if move_times['count'] > 0:
+            print('    move time p50/p95/p99: {:.6f} / {:.6f} / {:.6f}'.format(
+                move_times['p50'], move_times['p95'], move_times['p99']))
+        for stat, value in agent_search_stats[i].items():
+            print('    {}: {}'.format(stat, value))
+        agent_summaries.append({'name': agent.name, 'wins': agent_score, 'move_times': move_times,
+            'move_time_stats': agent_move_times[i].to_dict(), 'search_stats': agent_search_stats[i]})
+    print('Stalemates: {}'.format(num_stalemates))
+    print('Avg turns per game: {}'.format(total_turns / max(args.num_games, 1)))
+
+    if args.stats_json is not None:
+        with open(args.stats_json, 'w') as f:
+            json.dump({'seed': seed, 'num_games': args.num_games, 'stalemates': num_stalemates,
+                'total_turns': total_turns, 'agents': agent_summaries}, f, indent=1)
 
 if __name__=='__main__':
     main()
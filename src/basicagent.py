@@ -1,8 +1,19 @@
-import random, time
+import random, time, json, hashlib
 from hiddengame import *
 from game import *
 from move import *
 from cards import *
+from transposition import TranspositionTable
+from reachability import ReachabilityOracle, goal_distance
+from searchstats import NULL_STATS
+from beliefs import BeliefTracker, WILD_VALUES
+
+# stored in the transposition table for states that can't reach the goal of a search
+DEAD_STATE = False
+
+# default limits on the searches done for one move (None means no limit)
+DEFAULT_MAX_MOVE_MS = 200
+DEFAULT_MAX_NODES = None
 
 def rig_game(game, agent_id):
     '''
@@ -12,169 +23,403 @@ def rig_game(game, agent_id):
     game.player_hands[agent_id] = [Card(1, "Hearts"), Card(2, "Diamonds"), Card(3, "Hearts"), Card(4, "Clubs")]
     return game
 
+# weights of the heuristics in score_state and score_player_cards, which tuner.py tunes
+DEFAULT_WEIGHTS = {
+        # number of wilds added to another player's cards when working out how dangerous they are
+        'max_danger': 1,
+        # how much cards in a run are worth after a gap, relative to before it
+        'gap_factor': 0.5,
+        # weights of our cards' score and of each other player's danger in a state's score
+        'hand_weight': 1,
+        'danger_weight': 1,
+        # how much safer another player is for each goal card they have left (as a fraction of the goal size)
+        'goal_pile_weight': 0,
+        }
+
+def load_weights(path):
+    '''
+        Read a weights file (JSON with a 'weights' dict, as written by tuner.py)
+        Weights it doesn't have keep their defaults
+    '''
+    with open(path) as f:
+        weights = json.load(f)['weights']
+    unknown = set(weights) - set(DEFAULT_WEIGHTS)
+    if len(unknown) > 0:
+        raise RuntimeError("Unknown weights in {}: {}".format(path, ', '.join(sorted(unknown))))
+    return dict(DEFAULT_WEIGHTS, **weights)
+
+# score_run results with the default gap factor, keyed on its args - there are at most
+# 12 goal values * 2^12 masks * (wilds + 1) of them, and far fewer come up in practice
+RUN_SCORES = {}
+
+def score_run(goal_value, playable_mask, num_wild, gap_factor=DEFAULT_WEIGHTS['gap_factor']):
+    '''
+        Score a run of playable cards counting down from the goal card (see BasicAgent.score_player_cards)
+        playable_mask has bit n set if a non-wild card with value n is playable
+        Each value in the run is worth 1, wilds fill gaps, and after each gap the values are worth
+        gap_factor times as much
+    '''
+    score = 0
+    # this is the score that gets added as we count down from the goal card
+    curr_max_score = 1
+    # this value will decrease
+    curr_value = (goal_value + MAX_CARDS_PER_PLAY_PILE - 1) % MAX_CARDS_PER_PLAY_PILE
+    # count down until all possible card values are encountered
+    for _ in range(MAX_CARDS_PER_PLAY_PILE):
+        if playable_mask & (1 << curr_value):
+            score += curr_max_score
+        elif num_wild > 0:
+            # fill in gaps with wild cards
+            score += curr_max_score
+            num_wild -= 1
+        else:
+            # there's a gap in the run, so futher cards are less valuable
+            curr_max_score *= gap_factor
+        curr_value = (curr_value + MAX_CARDS_PER_PLAY_PILE - 1) % MAX_CARDS_PER_PLAY_PILE
+    return score
+
 class BasicAgent:
     '''
         A simple autonomous agent
     '''
-    def __init__(self):
+    def __init__(self, max_move_ms=DEFAULT_MAX_MOVE_MS, max_nodes=DEFAULT_MAX_NODES, track_beliefs=False, book=None,
+            weights=None):
+        '''
+            max_move_ms and max_nodes limit the wall-clock time and number of states expanded
+            when choosing a move - when either runs out, the best move found so far is used
+            If track_beliefs is True, unseen cards are tracked from every move (see observe()) and
+            used to estimate how likely other players are to play their goal cards
+            book is an optional PositionBook, which paths are looked up in and added to
+            weights changes some of DEFAULT_WEIGHTS - it's a dict, or the path of a weights file
+        '''
         # path to blindly follow (in reverse order, i.e. pop() each element)
         self.path = []
         self.name = 'BasicAgent'
-
-    def get_child_states(self, hg, allowed_moves, coalesce=True):
+        self.max_move_ms = max_move_ms
+        self.max_nodes = max_nodes
+        # shared by all the searches done in one get_move call
+        self.tt = TranspositionTable()
+        # kept for the whole game
+        self.oracle = ReachabilityOracle()
+        # number of states expanded over all searches
+        self.nodes_expanded = 0
+        # counters for the current move - replaced with a SearchStats by whoever wants them
+        self.stats = NULL_STATS
+        # number of moves where the budget ran out
+        self.budget_exceeded = 0
+        # limits for the current move
+        self.deadline = None
+        self.node_limit = None
+        # BeliefTracker, made on the first move if track_beliefs is True
+        self.track_beliefs = track_beliefs
+        self.beliefs = None
+        self.book = book
+        self.book_hits = 0
+        self.book_misses = 0
+        if isinstance(weights, str):
+            weights = load_weights(weights)
+        self.weights = dict(DEFAULT_WEIGHTS, **(weights or {}))
+        self.max_danger = max(1, int(round(self.weights['max_danger'])))
+        # run scores depend on the gap factor, so other gap factors get their own memo
+        self.run_scores = RUN_SCORES if self.weights['gap_factor'] == DEFAULT_WEIGHTS['gap_factor'] else {}
+
+    def new_search(self):
         '''
-            Given a HiddenGame, get all possible states made by playing
-            from the hand or from the discard piles
-            Return a list of tuples (move, HiddenGame)
-            Where move = (move_type, args)
+            Start choosing a new move - anything in the transposition table is now stale
         '''
-        states = []
-        legal_moves = hg.get_legal_moves()
+        self.tt.clear()
+        self.deadline = None
+        if self.max_move_ms is not None:
+            self.deadline = time.perf_counter() + self.max_move_ms / 1000
+        self.node_limit = None
+        if self.max_nodes is not None:
+            self.node_limit = self.nodes_expanded + self.max_nodes
+
+    def out_of_budget(self):
+        '''
+            Check if the time or node budget for this move has run out
+        '''
+        if self.node_limit is not None and self.nodes_expanded >= self.node_limit:
+            return True
+        if self.deadline is not None and time.perf_counter() >= self.deadline:
+            return True
+        return False
+
+    def get_search_stats(self):
+        stats = {
+                'nodes_expanded': self.nodes_expanded,
+                'tt_hits': self.tt.hits,
+                'tt_misses': self.tt.misses,
+                'budget_exceeded': self.budget_exceeded,
+                }
+        stats.update(self.oracle.get_stats())
+        if self.book is not None:
+            stats['book_hits'] = self.book_hits
+            stats['book_misses'] = self.book_misses
+        return stats
+
+    def get_child_moves(self, hg, allowed_moves, coalesce=True):
+        '''
+            Given a HiddenGame, get all the moves of the types in allowed_moves which lead to
+            different states (or all legal moves if coalesce is False)
+            Return a list of Moves
+        '''
+        self.nodes_expanded += 1
+        self.stats.add('child_move_calls')
 
         if coalesce:
-            legal_moves = list(legal_moves)
-            for move_type in allowed_moves:
-                # each bucket contains moves that are different but actually equivalent
-                # bucket key is a tuple of:
-                #   (MOVE_PLAY_GOAL, card_value, len(play_pile))
-                #   (MOVE_PLAY_HAND, card_value, len(play_pile))
-                #   (MOVE_PLAY_DISCARD, discard_pile, len(play_pile))
-                #   (MOVE_END_TURN, card_value, discard_pile)
-                buckets = {}
-                for move in legal_moves[move_type]:
-
-                    bucket_key = None
-
-                    if move_type == MOVE_PLAY_GOAL:
-                        card = hg.goal_cards[hg.current_player]
-                        play_pile = hg.play_piles[move.args[0]]
-                        bucket_key = (MOVE_PLAY_GOAL, card.value, len(play_pile))
-
-                    elif move_type == MOVE_PLAY_HAND:
-                        play_pile = hg.play_piles[move.args[1]]
-                        bucket_key = (MOVE_PLAY_HAND, move.args[0].value, len(play_pile))
+            return hg.get_coalesced_moves(allowed_moves)
 
-                    elif move_type == MOVE_PLAY_DISCARD:
-                        discard_pile = hg.discard_piles[hg.current_player][move.args[0]]
-                        play_pile = hg.play_piles[move.args[1]]
-                        bucket_key = (MOVE_PLAY_DISCARD, discard_pile, len(play_pile))
-
-                    elif move_type == MOVE_END_TURN:
-                        discard_piles = hg.discard_piles[hg.current_player]
-                        card = move.args[0]
-                        pile = discard_piles[move.args[1]]
-                        # TODO this doesn't work in all cases because king's value != joker's value
-                        bucket_key = (MOVE_END_TURN, card.value, pile)
+        moves = []
+        legal_moves = hg.get_legal_moves()
+        for move_type in allowed_moves:
+            moves += legal_moves[move_type]
+        return moves
 
-                    else:
-                        raise RuntimeError("Invalid move type!")
+    def move_priority(self, hg, move):
+        '''
+            Cheap guess at how good a move is, so the most promising moves can be searched first
+            Playing cards is better than ending the turn, since it cycles cards and frees up discard space
+            Higher is better
+        '''
+        if move.type == MOVE_PLAY_GOAL:
+            return 4
+        if move.type == MOVE_PLAY_DISCARD:
+            return 3
+        if move.type == MOVE_PLAY_HAND:
+            # save wilds for later if possible
+            return 1 if move.args[0].is_wild() else 2
+
+        # end of turn - don't throw away wilds, and try to build runs down from the top discard
+        card = move.args[0]
+        if card.is_wild():
+            return -1
+        pile = hg.discard_piles[hg.current_player][move.args[1]]
+        if len(pile) == 0:
+            return 0.5
+        if pile[-1].value == card.value + 1:
+            return 0.75
+        return 0
+
+    def get_ordered_child_moves(self, hg, allowed_moves):
+        '''
+            Same as get_child_moves, but sorted by move_priority so the best move is last
+        '''
+        moves = self.get_child_moves(hg, allowed_moves)
+        moves.sort(key=lambda move: self.move_priority(hg, move))
+        return moves
 
-                    buckets[bucket_key] = move
+    def find_path(self, hg, is_goal_state, tag):
+        '''
+            Search to find if there's a guaranteed path to get to a state defined by the function is_goal_state
+            tag identifies is_goal_state in the transposition table, so states found to be dead ends
+            are skipped by later searches for the same thing
+            The search applies and undoes moves on one copy of hg, rather than copying it for every state
+            Return path of moves in reverse order
+        '''
+        child_moves = [MOVE_PLAY_HAND, MOVE_PLAY_DISCARD, MOVE_PLAY_GOAL]
 
-                legal_moves[move_type] = buckets.values()
+        root_key = hg.state_key()
+        if self.tt.lookup(tag, root_key) is DEAD_STATE:
+            return None
 
-            legal_moves = tuple(legal_moves)
+        state = hg.copy_mutable()
+        if is_goal_state(state):
+            return []
+
+        seen = set([root_key])
+        # moves from hg to state, and the tokens to undo them
+        path = []
+        tokens = []
+        # moves left to try from each state on the path
+        stack = [self.get_child_moves(state, child_moves)]
+
+        while len(stack) > 0:
+
+            if self.out_of_budget():
+                # didn't search everything, so can't say anything about the states seen
+                self.stats.peak('peak_seen', len(seen))
+                return None
+
+            moves = stack[-1]
+            if len(moves) == 0:
+                # tried everything from this state, go back to its parent
+                stack.pop()
+                if len(tokens) > 0:
+                    state.undo(tokens.pop())
+                    path.pop()
+                continue
 
-        for move_type in allowed_moves:
-            for move in legal_moves[move_type]:
-                new_hg = hg.do_move(move)
-                states.append(new_hg)
-        
-        return states
+            move = moves.pop()
+            token = state.apply(move)
+            key = state.state_key()
+            if key in seen or self.tt.lookup(tag, key) is DEAD_STATE:
+                state.undo(token)
+                continue
+            seen.add(key)
+            path.append(move)
+            tokens.append(token)
+            self.stats.add('nodes')
+
+            if is_goal_state(state):
+                self.stats.peak('peak_seen', len(seen))
+                # reverse for later consumption
+                path.reverse()
+                return path
+
+            stack.append(self.get_child_moves(state, child_moves))
+            self.stats.peak('peak_stack', len(stack))
+
+        self.stats.peak('peak_seen', len(seen))
+        # searched everything reachable, so none of it leads to the goal
+        for key in seen:
+            self.tt.store(tag, key, DEAD_STATE)
+        return None
 
-    def find_path(self, hg, is_goal_state):
+    def find_path_to_goal(self, hg):
         '''
-            Search to find if there's a guaranteed path to get to a state defined by the function is_goal_state
-            Return path of states in reverse order
+            Find the shortest path to playing the goal card this turn, with a depth first branch and bound search
+            A state is cut off once the moves to it plus reachability.goal_distance (a lower bound on
+            the moves left) can't beat the shortest path found so far, and the search stops early if
+            a path is as short as the lower bound for hg
+            States which can't possibly reach the goal are pruned, and states whose children were all
+            dead ends are dead ends too
+            Like find_path, moves are applied and undone on one copy of hg
+            Return path of moves in reverse order
         '''
+        tag = 'goal'
         child_moves = [MOVE_PLAY_HAND, MOVE_PLAY_DISCARD, MOVE_PLAY_GOAL]
 
-        queue = [[hg]]
-        seen = set([hg])
-        goal_path = None
+        root_key = hg.state_key()
+        if self.tt.lookup(tag, root_key) is DEAD_STATE:
+            return None
+        state = hg.copy_mutable()
+        player = state.current_player
+        lower_bound = goal_distance(state, player)
+        if lower_bound is None:
+            self.tt.store(tag, root_key, DEAD_STATE)
+            return None
+
+        best = None
+        # fewest moves to each state seen
+        depths = {root_key: 0}
+        # moves from hg to state, the tokens to undo them and the keys of the states on the way
+        path = []
+        tokens = []
+        keys = [root_key]
+        # for each state on the path, the moves left to try and whether any of its children might reach the goal
+        stack = [[self.get_ordered_child_moves(state, child_moves), False]]
 
-        while len(queue) > 0:
+        while len(stack) > 0:
 
-            path = queue.pop()
-            if is_goal_state(path[-1]):
-                goal_path = path
+            if self.out_of_budget():
                 break
 
-            for child_state in self.get_child_states(path[-1], allowed_moves=child_moves):
-                if child_state in seen:
-                    continue
-                seen.add(child_state)
-                new_path = path[:] + [child_state]
-                queue.append(new_path)
+            frame = stack[-1]
+            if len(frame[0]) == 0:
+                # tried everything from this state
+                stack.pop()
+                key = keys.pop()
+                if not frame[1]:
+                    self.tt.store(tag, key, DEAD_STATE)
+                if len(tokens) > 0:
+                    state.undo(tokens.pop())
+                    path.pop()
+                    stack[-1][1] = stack[-1][1] or frame[1]
+                continue
 
-        if goal_path is None:
-            return None
+            move = frame[0].pop()
+            if move.type == MOVE_PLAY_GOAL:
+                frame[1] = True
+                best = path + [move]
+                if len(best) == lower_bound:
+                    break
+                continue
 
-        # get the moves from the states
-        path = [state.last_move for state in goal_path]
-        # pop empty move, and reverse for later consumption
-        path.pop(0)
-        path.reverse()
-        return path
+            depth = len(path) + 1
+            token = state.apply(move)
+            key = state.state_key()
+            if self.tt.lookup(tag, key) is DEAD_STATE:
+                state.undo(token)
+                continue
+            distance = goal_distance(state, player)
+            if distance is None:
+                self.tt.store(tag, key, DEAD_STATE)
+                state.undo(token)
+                continue
+            if (best is not None and depth + distance >= len(best)) or depths.get(key, depth + 1) <= depth:
+                # can't beat the best path, or already searched from a shorter path
+                frame[1] = True
+                state.undo(token)
+                continue
+            depths[key] = depth
+            self.stats.add('nodes')
 
-    def find_path_to_goal(self, hg):
-        goal_func = lambda state: True if state.last_move is not None and state.last_move.type == MOVE_PLAY_GOAL else False
-        return self.find_path(hg, goal_func)
+            path.append(move)
+            tokens.append(token)
+            keys.append(key)
+            stack.append([self.get_ordered_child_moves(state, child_moves), False])
+            self.stats.peak('peak_stack', len(stack))
+
+        self.stats.peak('peak_seen', len(depths))
+        if best is not None:
+            best.reverse()
+        return best
 
     def find_path_to_empty_hand(self, hg):
         goal_func = lambda state: True if len(state.player_hands[state.current_player]) == 0 else False
-        return self.find_path(hg, goal_func)
+        return self.find_path(hg, goal_func, 'empty_hand')
 
-    def score_player_cards(self, hg):
+    def score_player_cards(self, hg, player_id=None):
         '''
             Compute a score in the range (0,8] of how valuable a players immediately playable cards are
             Immediately playable cards are cards in the hand and discard pile
             A score of 8 is a run of 8 cards up to the current goal card
             A score close to 0 means most of the cards aren't near the goal card
+            player_id defaults to the current player
             Return normalized score between 0 and 1
         '''
+        if player_id is None:
+            player_id = hg.current_player
         MAX_SCORE = hg.hand_size + NUM_DISCARD_PILES
-        goal_card = hg.goal_cards[hg.current_player]
-        # treat wild goal card as max score
+        goal_card = hg.goal_cards[player_id]
+        # treat wild goal card as max score, and the same for a goal card that's just been played
         # (TODO maybe make this higher? or something... range of 0-12 with this being 12?)
-        if goal_card.is_wild():
+        if goal_card is None or goal_card.is_wild():
             return MAX_SCORE
-        player_hand = hg.player_hands[hg.current_player]
-        top_discard_cards = [pile[-1] for pile in hg.discard_piles[hg.current_player] if len(pile)]
-
-        playable_cards = []
-        playable_cards += player_hand
-        playable_cards += top_discard_cards
-        # remove wildcards and count them up
+        # playable cards are the hand and the top discard cards - wilds are counted, and the values
+        # of the rest are kept as a bitmask (bit n for value n), which removes duplicates too
+        playable_mask = 0
         num_wild = 0
-        for card in playable_cards:
-            if card.is_wild():
-                playable_cards.remove(card)
+        for card in hg.player_hands[player_id]:
+            if card.value >= 13:
                 num_wild += 1
-        # note that making this a set removes duplicates too
-        playable_card_values = set([card.value for card in playable_cards])
-
-        score = 0
-        # this is the score that gets added as we count down from the goal card
-        curr_max_score = 1
-        # this value will decrease
-        curr_value = (goal_card.value + MAX_CARDS_PER_PLAY_PILE - 1) % MAX_CARDS_PER_PLAY_PILE
-        # count down until all possible card values are encountered
-        for _ in range(MAX_CARDS_PER_PLAY_PILE):
-            if curr_value in playable_card_values:
-                score += curr_max_score
-                playable_card_values.remove(curr_value)
-            elif num_wild > 0:
-                # fill in gaps with wild cards
-                score += curr_max_score
-                num_wild -= 1
             else:
-                # there's a gap in the run, so futher cards can only be half as valuable
-                curr_max_score /= 2
-            curr_value = (curr_value + MAX_CARDS_PER_PLAY_PILE - 1) % MAX_CARDS_PER_PLAY_PILE
+                playable_mask |= 1 << card.value
+        for pile in hg.discard_piles[player_id]:
+            if len(pile) > 0:
+                if pile[-1].value >= 13:
+                    num_wild += 1
+                else:
+                    playable_mask |= 1 << pile[-1].value
+
+        key = (goal_card.value, playable_mask, num_wild)
+        score = self.run_scores.get(key)
+        if score is None:
+            score = self.run_scores[key] = score_run(*key, self.weights['gap_factor'])
         # normalize
         return score/MAX_SCORE
 
+    def goal_chance(self, hg, player_id):
+        '''
+            Chance that player_id can play their goal card on their turn, if their hand is full of
+            unseen cards - uses the belief tracker for the chance of holding enough wilds
+        '''
+        num_wilds = self.oracle.wilds_needed(hg, player_id, hg.hand_size)
+        if num_wilds is None:
+            return 0
+        return self.beliefs.chance_of_at_least(WILD_VALUES, num_wilds, hg.hand_size)
+
     def score_state(self, hg, player_id):
         '''
             Determine how valuable a state is for player_id
@@ -182,45 +427,43 @@ class BasicAgent:
             Assumes current player can't empty their hand or play their goal card this turn
             Return a score between 0 and 1
         '''
+        self.stats.add('score_state')
         # score our cards
-        new_hg = hg.copy_mutable()
-        new_hg.current_player = player_id
-        new_hg.make_immutable()
-        hand_score = self.score_player_cards(new_hg)
-
-        # this will contain numbers 0 - 5 representing how close another player is to playing
-        # their goal card (0 is they can play it NOW, 5 is they can't play it even if holding 4 wilds)
-        MAX_DANGER = 1 # hg.hand_size + 1
-        other_players_danger = [0 for _ in range(hg.num_players)]
-
-        #start = time.perf_counter()
-        
+        hand_score = self.score_player_cards(hg, player_id)
+
+        # this will contain numbers 0 - max_danger representing how close another player is to playing
+        # their goal card (0 is they can play it NOW, max_danger is they can't even with max_danger - 1 wilds)
+        MAX_DANGER = self.max_danger
+        other_players_danger = [MAX_DANGER for _ in range(hg.num_players)]
+
         # score other player's hands based on what we can see
-        for player_id in range(hg.num_players):
-            if player_id == hg.current_player:
+        for other_id in range(hg.num_players):
+            if other_id == player_id:
+                continue
+            if self.beliefs is not None:
+                other_players_danger[other_id] = MAX_DANGER * (1 - self.goal_chance(hg, other_id))
                 continue
             # add up to hand_size wild cards to enemy player's hand
             # determine how dangerous they are based on how many must be added for them to
             # be able to play their goal card
-            new_hg = hg.copy_mutable()
-            new_hg.current_player = player_id
             for num_wilds in range(MAX_DANGER):
-                new_hg.player_hands[player_id] = [Card(14, "")] * num_wilds
-                immut_hg = new_hg.copy_mutable()
-                immut_hg.make_immutable()
-                if self.find_path_to_goal(immut_hg) is not None:
-                    other_players_danger[player_id] = num_wilds
+                if self.oracle.can_play_goal(hg, other_id, num_wilds):
+                    other_players_danger[other_id] = num_wilds
                     break
 
-        #print(time.perf_counter() - start)
-        
         # normalize the dangers
         other_players_danger = [d/MAX_DANGER for d in other_players_danger]
-        # TODO modulate the danger of opposing players by the size of their goal pile
-        # higher pile means it's less dangerous (a little) to let them play
-        all_scores = other_players_danger
-        all_scores[hg.current_player] = hand_score
-        return sum([score/len(all_scores) for score in all_scores])
+        # a bigger goal pile means it's less dangerous (a little) to let them play
+        goal_pile_weight = self.weights['goal_pile_weight']
+        if goal_pile_weight != 0:
+            goal_pile_sizes = hg.get_pile_sizes()[0]
+            for other_id, danger in enumerate(other_players_danger):
+                safety = min(1, goal_pile_weight * goal_pile_sizes[other_id] / hg.goal_size)
+                other_players_danger[other_id] = danger + (1 - danger) * safety
+        hand_weight = self.weights['hand_weight']
+        danger_weight = self.weights['danger_weight']
+        total = hand_weight * hand_score + danger_weight * (sum(other_players_danger) - other_players_danger[player_id])
+        return total / (hand_weight + danger_weight * (hg.num_players - 1))
 
     def do_good_moves(self, hg):
         '''
@@ -254,32 +497,66 @@ class BasicAgent:
 
         # TODO: play as many cards as possible; this isn't happening rn, throwing away good paths
 
-        # Search for the best path
+        return self.find_best_paths(hg, 1)[0]
+
+    def find_best_paths(self, hg, num_paths):
+        '''
+            Search the paths which end the turn, and score the states they lead to
+            Return up to num_paths paths (each in reverse order), best first
+        '''
         child_moves = [MOVE_PLAY_HAND, MOVE_PLAY_DISCARD, MOVE_PLAY_GOAL, MOVE_END_TURN]
         # enumerate all paths that terminate in MOVE_END_TURN
-        # queue of paths, not just states
-        queue = [[hg]]
-        seen = set([hg])
-        best_path = None
-        best_score = 0
+        # the search applies and undoes moves on one copy of hg
+        # this is an anytime search - the most promising moves are tried first, and when the budget
+        # runs out the best path found so far is used
+        state = hg.copy_mutable()
+        seen = set([hg.state_key()])
+        path = []
+        tokens = []
+        stack = [self.get_ordered_child_moves(state, child_moves)]
+        # (score, path) of the best paths found so far, best first
+        best = []
         num_paths_found = 0
         MAX_PATHS_FOUND = 100
 
-        # TODO order the queue and cap the search depth/time
+        while len(stack) > 0:
+
+            # keep going until there's at least one path
+            if len(best) > 0 and self.out_of_budget():
+                break
 
-        while len(queue) > 0:
+            moves = stack[-1]
+            if len(moves) == 0:
+                stack.pop()
+                if len(tokens) > 0:
+                    state.undo(tokens.pop())
+                    path.pop()
+                continue
 
-            path = queue.pop()
-            if path[-1].last_move is not None and path[-1].last_move.type == MOVE_END_TURN:
+            move = moves.pop()
+            token = state.apply(move)
+            key = state.state_key()
+            if key in seen:
+                state.undo(token)
+                continue
+            seen.add(key)
+            self.stats.add('nodes')
 
-                if best_path is None:
-                    best_path = path
+            if move.type == MOVE_END_TURN:
+
+                if len(best) == 0 and self.out_of_budget():
+                    # no time to score it, but it's better than nothing
+                    best.append((-1, path + [move]))
                 else:
-                    # score the last state to evaluate which path to keep
-                    score = self.score_state(path[-1], hg.current_player)
-                    if score > best_score:
-                        best_path = path
-                        best_score = score
+                    # score the last state to evaluate which paths to keep
+                    score = self.score_state(state, hg.current_player)
+                    # if the budget ran out while scoring, the score can't be trusted
+                    if len(best) == 0 or (not self.out_of_budget() and \
+                            (len(best) < num_paths or score > best[-1][0])):
+                        best.append((score, path + [move]))
+                        best.sort(key=lambda entry: entry[0], reverse=True)
+                        del best[num_paths:]
+                state.undo(token)
 
                 # TODO: maybe don't have to do this?
                 num_paths_found += 1
@@ -288,34 +565,97 @@ class BasicAgent:
 
                 continue
 
-            for child_state in self.get_child_states(path[-1], child_moves):
-                if child_state in seen:
-                    continue
-                seen.add(child_state)
-                new_path = path[:] + [child_state]
-                queue.append(new_path)
-
-        path = [state.last_move for state in best_path]
-        path.pop(0)
-        path.reverse()
+            path.append(move)
+            tokens.append(token)
+            stack.append(self.get_ordered_child_moves(state, child_moves))
+            self.stats.peak('peak_stack', len(stack))
 
-        return path
-
-    def get_move(self, hidden_game):
+        self.stats.peak('peak_seen', len(seen))
+        self.stats.add('paths_found', num_paths_found)
+        paths = [path for score, path in best]
+        for path in paths:
+            path.reverse()
 
-        if len(self.path) > 0:
-            return self.path.pop()
+        return paths
 
+    def choose_path(self, hidden_game):
+        '''
+            Search for the moves to do this turn
+            Return the path of moves in reverse order
+        '''
         # try to play a goal card at all costs
-        self.path = self.find_path_to_goal(hidden_game)
-        if self.path is not None:
-            return self.path.pop()
+        path = self.find_path_to_goal(hidden_game)
+        if path is not None:
+            return path
 
         # if no guaranteed goal path, try to empty hand
-        self.path = self.find_path_to_empty_hand(hidden_game)
-        if self.path is not None:
-            return self.path.pop()
+        path = self.find_path_to_empty_hand(hidden_game)
+        if path is not None:
+            return path
 
         # this always returns a path
-        self.path = self.do_good_moves(hidden_game)
+        path = self.do_good_moves(hidden_game)
+        if self.out_of_budget():
+            self.budget_exceeded += 1
+        return path
+
+    def choose_path_from_book(self, hidden_game):
+        '''
+            Look for a path in the position book, and if it's not there, choose one and add it
+            The book isn't used when tracking beliefs, since they change how states are scored
+        '''
+        if self.book is None or self.beliefs is not None:
+            return self.choose_path(hidden_game)
+        book_name = self.get_book_name()
+        goal_pile_sizes = self.weights['goal_pile_weight'] != 0
+        path = self.book.lookup(book_name, hidden_game, goal_pile_sizes)
+        if path is not None:
+            self.book_hits += 1
+            self.stats.add('book_hits')
+            return path
+        self.book_misses += 1
+        path = self.choose_path(hidden_game)
+        # paths from searches which were cut short may not be good enough to keep
+        if not self.out_of_budget():
+            self.book.store(book_name, hidden_game, path, goal_pile_sizes)
+        return path
+
+    def get_book_name(self):
+        '''
+            Return the name the agent's paths are kept under in the position book
+            Weights change which paths are chosen, so agents with other weights get their own entries
+        '''
+        if self.weights == DEFAULT_WEIGHTS:
+            return self.name
+        weights = json.dumps(self.weights, sort_keys=True).encode()
+        return '{}-{}'.format(self.name, hashlib.blake2b(weights, digest_size=4).hexdigest())
+
+    def new_game(self):
+        '''
+            Get ready to play another game with the same agent
+            The reachability cache only depends on the state, so it's kept
+        '''
+        self.path = []
+        self.beliefs = None
+
+    def observe(self, revealed, hidden):
+        '''
+            Called after every move (by anyone) with what this agent learned from it, see beliefs.public_events
+        '''
+        if self.beliefs is not None:
+            self.beliefs.observe(revealed, hidden)
+
+    def get_move(self, hidden_game):
+
+        if self.track_beliefs and self.beliefs is None:
+            # later moves are tracked with observe()
+            self.beliefs = BeliefTracker(hidden_game)
+
+        if len(self.path) == 0:
+            tt_hits, tt_misses = self.tt.hits, self.tt.misses
+            self.new_search()
+            self.path = self.choose_path_from_book(hidden_game)
+            self.stats.add('tt_hits', self.tt.hits - tt_hits)
+            self.stats.add('tt_misses', self.tt.misses - tt_misses)
+
         return self.path.pop()
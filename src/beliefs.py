@@ -0,0 +1,118 @@
+'''
+    Tracking which cards a player hasn't seen, updated from each move instead of rescanning the game
+'''
+from math import comb
+
+from cards import CARD_FOR_VALUE, card_code, make_decks
+from game import UNDO_TAKE_HAND, UNDO_ADD_HAND, UNDO_GOAL, UNDO_CLEAR_PLAY_PILE
+
+# counts are indexed by card value, so index 0 is unused
+NUM_COUNTS = 15
+WILD_VALUES = (13, 14)
+
+def public_events(undo_log, viewer):
+    '''
+        Work out what viewer learns from a move, given the undo log from Game.apply
+        Return (revealed, hidden): cards viewer can now see for the first time, and cards which
+        went back into the draw pile
+        Cards drawn into other players' hands aren't revealed
+    '''
+    revealed = []
+    hidden = []
+    for i, change in enumerate(undo_log):
+        kind = change[0]
+        if kind == UNDO_TAKE_HAND:
+            # cards leaving viewer's own hand were seen when they were drawn
+            if change[1] != viewer:
+                revealed.append(change[3])
+        elif kind == UNDO_ADD_HAND:
+            # the draw is logged just before the card goes in the hand
+            if change[1] == viewer:
+                revealed.append(undo_log[i - 1][3])
+        elif kind == UNDO_GOAL:
+            # a goal card being replaced with None is followed by flipping the next one
+            if change[2] is None:
+                revealed.append(undo_log[i + 1][3])
+        elif kind == UNDO_CLEAR_PLAY_PILE:
+            hidden += change[2]
+    return revealed, hidden
+
+class BeliefTracker:
+    '''
+        Counts of each card value one player hasn't seen, i.e. in the draw pile, goal piles and other hands
+        Made by scanning a view once, then kept up to date with observe()
+    '''
+    def __init__(self, hg, player_id=None):
+        if player_id is None:
+            player_id = hg.current_player
+        self.player_id = player_id
+        self.counts = [0 for _ in range(NUM_COUNTS)]
+        for card in make_decks(hg.num_decks):
+            self.counts[card.value] += 1
+
+        visible = list(hg.player_hands[player_id]) + [card for card in hg.goal_cards if card is not None]
+        for piles in hg.discard_piles:
+            for pile in piles:
+                visible += pile
+        for pile in hg.play_piles:
+            visible += pile
+        for card in visible:
+            self.counts[card.value] -= 1
+        self.num_unseen = sum(self.counts)
+        # chance_of_at_least results, which only change when the counts do
+        self.chances = {}
+
+    def observe(self, revealed, hidden):
+        '''
+            Update the counts with the output of public_events
+        '''
+        for card in revealed:
+            self.counts[card.value] -= 1
+        for card in hidden:
+            self.counts[card.value] += 1
+        self.num_unseen += len(hidden) - len(revealed)
+        if len(revealed) > 0 or len(hidden) > 0:
+            self.chances.clear()
+
+    def probability(self, values):
+        '''
+            Chance that an unseen card has one of values
+        '''
+        if self.num_unseen == 0:
+            return 0
+        return sum(self.counts[value] for value in values) / self.num_unseen
+
+    def chance_of_at_least(self, values, num_cards, hand_size):
+        '''
+            Chance that a hand of hand_size unseen cards has at least num_cards cards with one of values
+        '''
+        if num_cards <= 0:
+            return 1
+        key = (values, num_cards, hand_size)
+        if key not in self.chances:
+            self.chances[key] = self._chance_of_at_least(values, num_cards, hand_size)
+        return self.chances[key]
+
+    def _chance_of_at_least(self, values, num_cards, hand_size):
+        hand_size = min(hand_size, self.num_unseen)
+        matching = sum(self.counts[value] for value in values)
+        total = comb(self.num_unseen, hand_size)
+        if total == 0:
+            return 0
+        # hypergeometric - add up the chances of fewer than num_cards matches
+        fewer = sum(comb(matching, k) * comb(self.num_unseen - matching, hand_size - k) for k in range(num_cards))
+        return 1 - fewer / total
+
+    def unseen_codes(self):
+        '''
+            Return card codes for every unseen card, with the first suit of each value
+        '''
+        return [card_code(CARD_FOR_VALUE[value]) for value in range(1, NUM_COUNTS) for _ in range(self.counts[value])]
+
+def notify_agents(agents, undo_log):
+    '''
+        Tell every agent with an observe() method what it learned from a move
+    '''
+    for player, agent in enumerate(agents):
+        if hasattr(agent, 'observe'):
+            agent.observe(*public_events(undo_log, player))
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+'''
+    Benchmarks for the game engine and agent hot paths
+    Positions are stored in bench_positions.json so every run times the same work
+'''
+import random, argparse, json, time, os, sys
+
+from game import Game, game_to_dict, game_from_dict
+from hiddengame import HiddenGame
+from basicagent import BasicAgent
+from randomagent import RandomAgent
+from gamerunner import GameRunner
+from move import *
+from utils import copy_nested
+
+POSITIONS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench_positions.json')
+ALL_MOVES = [MOVE_PLAY_HAND, MOVE_PLAY_DISCARD, MOVE_PLAY_GOAL, MOVE_END_TURN]
+DEFAULT_THRESHOLD = 0.1
+# minimum time for one timing sample, in seconds
+MIN_SAMPLE_TIME = 0.2
+
+def make_positions(num_positions, seed):
+    '''
+        Make positions from the start of turns in games between BasicAgent and RandomAgent
+    '''
+    random.seed(seed)
+    positions = []
+    while len(positions) < num_positions:
+        game = Game(goal_size=10)
+        agents = [BasicAgent(max_move_ms=None), RandomAgent(max_move_ms=None)]
+        # stop at a random turn
+        stop_turn = random.randrange(1, 40)
+        turn = 1
+        while game.winner is None and not game.is_stalemate():
+            if turn == stop_turn:
+                positions.append(game_to_dict(game))
+                break
+            move = agents[game.current_player].get_move(HiddenGame(game))
+            game = game.do_move(move)
+            if move.type == MOVE_END_TURN:
+                turn += 1
+    return positions
+
+def load_positions():
+    with open(POSITIONS_FILE) as f:
+        return [game_from_dict(data) for data in json.load(f)]
+
+def time_per_call(func, items, repeats, min_time=MIN_SAMPLE_TIME):
+    '''
+        Time calling func on every item, going over the items as many times as needed to take at least
+        min_time seconds. Do that repeats times and return the best time per call in seconds
+    '''
+    best = None
+    for _ in range(repeats):
+        calls = 0
+        start = time.perf_counter()
+        while True:
+            for item in items:
+                func(item)
+            calls += len(items)
+            elapsed = time.perf_counter() - start
+            if elapsed >= min_time:
+                break
+        if best is None or elapsed / calls < best:
+            best = elapsed / calls
+    return best
+
+def fresh_agent_call(method_name):
+    '''
+        Call a BasicAgent method with a fresh agent each time, so nothing is cached between calls
+    '''
+    def call(hg):
+        agent = BasicAgent(max_move_ms=None)
+        agent.new_search()
+        return getattr(agent, method_name)(hg)
+    return call
+
+def play_full_game(seed):
+    random.seed(seed)
+    agents = [BasicAgent(max_move_ms=None), RandomAgent(max_move_ms=None)]
+    return GameRunner(Game(goal_size=10, seed=seed), agents, verbose=False).play()
+
+def run_benchmarks(repeats, num_games, only=None):
+    '''
+        Return a dict of benchmark name to seconds per operation
+    '''
+    games = load_positions()
+    hidden_games = [HiddenGame(game) for game in games]
+    first_moves = [hg.get_coalesced_moves(ALL_MOVES)[0] for hg in hidden_games]
+    hg_moves = list(zip(hidden_games, first_moves))
+    seeds = list(range(len(games)))
+    # BasicAgent only looks for good moves when it can't play its goal card
+    no_goal_games = [hg for hg in hidden_games if fresh_agent_call('find_path_to_goal')(hg) is None]
+
+    def deal(seed):
+        return Game(goal_size=10, seed=seed)
+
+    def score_state(hg):
+        agent = BasicAgent(max_move_ms=None)
+        return agent.score_state(hg, hg.current_player)
+
+    def apply_undo(hg_move):
+        hg, move = hg_move
+        state = hg.copy_mutable()
+        state.undo(state.apply(move))
+
+    benchmarks = [
+            ('deal', deal, seeds),
+            ('copy_nested', lambda game: copy_nested([game.goal_piles, game.player_hands, game.discard_piles,
+                game.play_piles, game.draw_pile]), games),
+            ('hiddengame_init', HiddenGame, games),
+            ('get_legal_moves', lambda hg: hg.get_legal_moves(), hidden_games),
+            ('get_coalesced_moves', lambda hg: hg.get_coalesced_moves(ALL_MOVES), hidden_games),
+            ('do_move', lambda hg_move: hg_move[0].do_move(hg_move[1]), hg_moves),
+            ('apply_undo', apply_undo, hg_moves),
+            ('find_path_to_goal', fresh_agent_call('find_path_to_goal'), hidden_games),
+            ('find_path_to_empty_hand', fresh_agent_call('find_path_to_empty_hand'), hidden_games),
+            ('do_good_moves', fresh_agent_call('do_good_moves'), no_goal_games),
+            ('score_state', score_state, hidden_games),
+        ]
+
+    results = {}
+    for name, func, items in benchmarks:
+        if only is not None and name not in only:
+            continue
+        results[name] = time_per_call(func, items, repeats)
+
+    if only is None or 'full_game' in only:
+        # games take a while, so only time them once
+        results['full_game'] = time_per_call(play_full_game, list(range(num_games)), 1, min_time=0)
+
+    return results
+
+def compare(results, baseline, threshold):
+    '''
+        Print how results compare to baseline, and return the names of benchmarks that are more than
+        threshold (a fraction) slower
+    '''
+    regressions = []
+    for name, seconds in results.items():
+        if name not in baseline:
+            print('{:>25}: {:12.3f} us  (new)'.format(name, seconds * 1e6))
+            continue
+        ratio = seconds / baseline[name]
+        flag = ''
+        if ratio > 1 + threshold:
+            flag = '  REGRESSION'
+            regressions.append(name)
+        print('{:>25}: {:12.3f} us  {:6.2f}x baseline{}'.format(name, seconds * 1e6, ratio, flag))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the game engine and agents")
+    parser.add_argument('-r', '--repeats', type=int, default=5, help='number of times to time each benchmark (best is kept)')
+    parser.add_argument('-g', '--num-games', type=int, default=10, dest='num_games', help='number of full games to time')
+    parser.add_argument('--only', nargs='+', help='only run these benchmarks')
+    parser.add_argument('--save', metavar='FILE', help='save results as a JSON baseline')
+    parser.add_argument('--compare', metavar='FILE', help='compare results to a JSON baseline')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+            help='fraction slower than the baseline that counts as a regression')
+    parser.add_argument('--make-positions', type=int, metavar='N', dest='make_positions',
+            help='regenerate the stored positions with N positions, then exit')
+    parser.add_argument('-s', '--seed', type=int, default=0, help='seed for --make-positions')
+    args = parser.parse_args()
+
+    if args.make_positions is not None:
+        with open(POSITIONS_FILE, 'w') as f:
+            json.dump(make_positions(args.make_positions, args.seed), f)
+        return
+
+    results = run_benchmarks(args.repeats, args.num_games, args.only)
+
+    if args.save is not None:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    if args.compare is not None:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        if len(regressions) > 0:
+            print('Regressions: {}'.format(', '.join(regressions)))
+            sys.exit(1)
+    else:
+        for name, seconds in results.items():
+            print('{:>25}: {:12.3f} us'.format(name, seconds * 1e6))
+
+if __name__=='__main__':
+    main()
@@ -29,25 +29,75 @@ WILD_VALUES=[13,14]
 class Card:
     '''
         A card in the game spite and malice
+        Cards are immutable and interned: there's one Card for each value and suit (both jokers are
+        the same Card), so Card(value, suite) returns the existing one and cards can be compared with is
+        code is the card's card_code and canonical its canonical_value
     '''
-    def __init__(self, value, suite):
-        self.value = value
-        self.suite = suite
+    __slots__ = ('value', 'suite', 'code', 'canonical')
+
+    def __new__(cls, value, suite):
+        card = INTERNED_CARDS.get((value, suite))
+        if card is None:
+            card = object.__new__(cls)
+            object.__setattr__(card, 'value', value)
+            object.__setattr__(card, 'suite', suite)
+            object.__setattr__(card, 'code', NUM_SUITES * 13 if value == 14 else (value - 1) * NUM_SUITES + SUITES.index(suite))
+            object.__setattr__(card, 'canonical', min(value, 13))
+            INTERNED_CARDS[(value, suite)] = card
+        return card
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Cards can't be changed")
+
+    def __reduce__(self):
+        # unpickled cards are the interned ones too
+        return (Card, (self.value, self.suite))
 
     def is_wild(self):
         return self.value in WILD_VALUES
 
-    def __hash__(self):
-        return 13 if self.is_wild() else self.value
+    def __eq__(self, other):
+        if self is other:
+            return True
+        if not isinstance(other, Card):
+            return NotImplemented
+        return self.value == other.value and self.suite == other.suite
+
+    # equal cards are the same object, so the identity hash matches __eq__ and is computed in C,
+    # which keeps interning moves (hashed on their cards) cheap
+    __hash__ = object.__hash__
 
     def __repr__(self):
         if self.value == 14:
             return "Joker"
         return "{} of {}".format(VALUE_TO_CARD_NAME[self.value], self.suite)
 
+# (value, suite) -> Card
+INTERNED_CARDS = {}
+
+def canonical_value(card):
+    '''
+        Value of a card as far as the rules are concerned
+        Kings and jokers are both wild, so they are folded together as 13
+        No card (e.g. an already played goal card) is 0
+    '''
+    if card is None:
+        return 0
+    return card.canonical
+
 DECK=[Card(value, suite) for value in list(VALUE_TO_CARD_NAME.keys())[:13] for suite in SUITES] + \
         [Card(14, None), Card(14, None)]
 
+# a card for each value (index 0 is unused), for when only the value of a card is known
+CARD_FOR_VALUE=[None] + [DECK[(value - 1) * NUM_SUITES] for value in range(1, 14)] + [DECK[NUM_SUITES * 13]]
+
+def card_code(card):
+    '''
+        Encode a card as a small int so the value and suit fit in one byte
+        The code is the card's index in DECK - both jokers are encoded as the first joker
+    '''
+    return card.code
+
 def make_decks(N):
     '''
         Create a list containing N full decks of Cards
@@ -57,17 +107,25 @@ def make_decks(N):
         ret += DECK[:]
     return ret
 
-def draw(pile):
+def draw(pile, rng=random):
     '''
         Draw a card randomly from a pile
         A pile is just a list of Cards
+        rng is a random.Random, or the random module
     '''
     if len(pile) == 0:
         return None
-    index = random.randrange(0, len(pile))
-    return pile.pop(index)
+    return draw_with_index(pile, rng)[1]
+
+def draw_with_index(pile, rng=random):
+    '''
+        Draw a card randomly from a non-empty pile
+        Return (index, card), where index is where the card was in the pile
+    '''
+    index = rng.randrange(0, len(pile))
+    return index, pile.pop(index)
 
-def draw_N(pile, N):
+def draw_N(pile, N, rng=random):
     if N > len(pile):
         raise RuntimeError("Can't draw that many cards!")
-    return [draw(pile) for _ in range(N)]
+    return [draw(pile, rng) for _ in range(N)]
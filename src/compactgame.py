@@ -0,0 +1,355 @@
+'''
+    A compact, integer-encoded version of HiddenGame for searching through lots of states
+'''
+from cards import DECK, CARD_FOR_VALUE, card_code
+from game import NUM_DISCARD_PILES, NUM_PLAY_PILES, MAX_CARDS_PER_PLAY_PILE
+from move import *
+from utils import copy_nested
+from movegen import coalesced_moves
+
+# hands are counts of each card value, ace (index 0) to joker (index 13)
+NUM_CARD_VALUES=14
+# code for a missing goal card
+NO_CARD=255
+# value of each card code
+CODE_VALUES=bytes(card.value for card in DECK)
+# canonical value of each card code, for bytes.translate
+CODE_CANONICAL_VALUES=bytes(card.canonical for card in DECK) + bytes(256 - len(DECK))
+
+def replace_item(items, index, item):
+    '''
+        Return a copy of a tuple with one item replaced
+    '''
+    return items[:index] + (item,) + items[index + 1:]
+
+class CompactGame:
+    '''
+        A Game from one player's perspective, like HiddenGame, stored as small ints
+        Cards are encoded with card_code
+        Hands are bytes of NUM_CARD_VALUES counts, or None if they're hidden
+        Discard piles are bytes of card codes, with the top card last
+        Play piles share one bytes buffer with NUM_PLAY_PILES slots of MAX_CARDS_PER_PLAY_PILE codes,
+        and the length of each is in play_lengths
+        do_move() returns a new CompactGame sharing everything that didn't change, and apply() changes
+        the game in place and can be reversed with undo()
+
+        The usual Game attributes (player_hands, discard_piles, play_piles and goal_cards) are decoded on demand
+        copy_mutable() decodes them into lists that can be edited, and make_immutable() encodes them again
+    '''
+    __slots__ = ('num_players', 'num_decks', 'hand_size', 'goal_size', 'current_player', 'winner', 'last_move',
+            'goals', 'hands', 'discards', 'play_buffer', 'play_lengths', 'pile_sizes', 'decoded')
+
+    def __init__(self, game):
+
+        self.num_players = game.num_players
+        self.num_decks = game.num_decks
+        self.hand_size = game.hand_size
+        self.goal_size = game.goal_size
+
+        self.current_player = game.current_player
+        self.winner = game.winner
+        self.last_move = None
+        self.decoded = None
+        self.pile_sizes = game.get_pile_sizes()
+
+        self.encode(game.goal_cards, game.player_hands, game.discard_piles, game.play_piles)
+        # mask other player hands
+        self.hands = tuple(
+                hand if i == self.current_player else None for i, hand in enumerate(self.hands)
+            )
+
+    def encode(self, goal_cards, player_hands, discard_piles, play_piles):
+        '''
+            Set the compact state from lists of Cards
+        '''
+        self.goals = bytes(NO_CARD if card is None else card_code(card) for card in goal_cards)
+
+        hands = []
+        for hand in player_hands:
+            if hand is None:
+                hands.append(None)
+                continue
+            counts = bytearray(NUM_CARD_VALUES)
+            for card in hand:
+                counts[card.value - 1] += 1
+            hands.append(bytes(counts))
+        self.hands = tuple(hands)
+
+        self.discards = tuple(
+                tuple(bytes(card_code(card) for card in pile) for pile in piles) for piles in discard_piles
+            )
+
+        play_buffer = bytearray(NUM_PLAY_PILES * MAX_CARDS_PER_PLAY_PILE)
+        for i, pile in enumerate(play_piles):
+            for j, card in enumerate(pile):
+                play_buffer[i * MAX_CARDS_PER_PLAY_PILE + j] = card_code(card)
+        self.play_buffer = bytes(play_buffer)
+        self.play_lengths = bytes(len(pile) for pile in play_piles)
+
+    def decode(self):
+        '''
+            Return the state as (goal_cards, player_hands, discard_piles, play_piles) made of Cards
+            Hands only record card values, so each card in a hand is the first card in DECK with that value
+        '''
+        goal_cards = [None if code == NO_CARD else DECK[code] for code in self.goals]
+        player_hands = [
+                None if counts is None else
+                [CARD_FOR_VALUE[i + 1] for i in range(NUM_CARD_VALUES) for _ in range(counts[i])]
+                for counts in self.hands
+            ]
+        discard_piles = [[[DECK[code] for code in pile] for pile in piles] for piles in self.discards]
+        play_piles = []
+        for i in range(NUM_PLAY_PILES):
+            start = i * MAX_CARDS_PER_PLAY_PILE
+            play_piles.append([DECK[code] for code in self.play_buffer[start:start + self.play_lengths[i]]])
+        return goal_cards, player_hands, discard_piles, play_piles
+
+    def get_pile_sizes(self):
+        '''
+            Pile sizes when the view was made - they aren't updated by moves
+        '''
+        return self.pile_sizes
+
+    @property
+    def goal_cards(self):
+        if self.decoded is not None:
+            return self.decoded[0]
+        return tuple(None if code == NO_CARD else DECK[code] for code in self.goals)
+
+    @property
+    def player_hands(self):
+        if self.decoded is not None:
+            return self.decoded[1]
+        return tuple(None if hand is None else tuple(hand) for hand in self.decode()[1])
+
+    @property
+    def discard_piles(self):
+        if self.decoded is not None:
+            return self.decoded[2]
+        return tuple(tuple(tuple(DECK[code] for code in pile) for pile in piles) for piles in self.discards)
+
+    @property
+    def play_piles(self):
+        if self.decoded is not None:
+            return self.decoded[3]
+        return tuple(tuple(pile) for pile in self.decode()[3])
+
+    def copy(self):
+        '''
+            Shallow copy - the compact state is immutable, so it can be shared
+        '''
+        clone = CompactGame.__new__(CompactGame)
+        for attr in CompactGame.__slots__:
+            setattr(clone, attr, getattr(self, attr))
+        return clone
+
+    def copy_mutable(self):
+        '''
+            Clone the game, decoding the cards into lists which can be edited
+        '''
+        clone = self.copy()
+        if self.decoded is not None:
+            clone.decoded = tuple(copy_nested(cards) for cards in self.decoded)
+        else:
+            clone.decoded = self.decode()
+        return clone
+
+    def make_immutable(self):
+        '''
+            Encode any edits made after copy_mutable()
+        '''
+        if self.decoded is None:
+            return
+        decoded = self.decoded
+        self.decoded = None
+        self.encode(*decoded)
+
+    def is_valid_play(self, card, play_pile_index):
+        '''
+            Check if a card can be played onto a given play pile
+        '''
+        return self.is_valid_value(card.value, play_pile_index)
+
+    def is_valid_value(self, value, play_pile_index):
+        '''
+            Check if a card with the given value can be played onto a given play pile
+        '''
+        if value >= 13:
+            return True
+        return self.play_lengths[play_pile_index] + 1 == value
+
+    def state_key(self):
+        '''
+            Same as HiddenGame.state_key, but computed from the compact state
+        '''
+        if self.decoded is not None:
+            clone = self.copy()
+            clone.make_immutable()
+            return clone.state_key()
+
+        player = self.current_player
+        ended_turn = self.last_move is not None and self.last_move.type == MOVE_END_TURN
+        if ended_turn:
+            player = (player - 1) % self.num_players
+
+        hand = self.hands[player]
+        if hand is not None:
+            # kings and jokers both count as 13
+            hand = tuple(
+                    min(value, 13) for value in range(1, NUM_CARD_VALUES + 1) for _ in range(hand[value - 1])
+                )
+        discard_piles = tuple(sorted([tuple(pile.translate(CODE_CANONICAL_VALUES)) for pile in self.discards[player]]))
+        goal = self.goals[player]
+        goal = 0 if goal == NO_CARD else min(CODE_VALUES[goal], 13)
+
+        return (player, ended_turn, goal, hand, discard_piles, tuple(sorted(self.play_lengths)))
+
+    def get_legal_moves(self):
+        '''
+            Return a tuple of all legal moves for the current player, indexed by move type
+            Each entry is a list of moves for a type of move
+            Moves from the hand use the first card in DECK with the right value
+        '''
+        # edits made after copy_mutable() need to be encoded first
+        self.make_immutable()
+        from_goal = []
+        from_hand = []
+        from_discard = []
+        end_turn = []
+        player = self.current_player
+
+        hand = self.hands[player]
+        for i in range(NUM_CARD_VALUES):
+            if hand[i] == 0:
+                continue
+            card = CARD_FOR_VALUE[i + 1]
+            for _ in range(hand[i]):
+                for j in range(NUM_PLAY_PILES):
+                    if self.is_valid_value(i + 1, j):
+                        from_hand.append(Move(MOVE_PLAY_HAND, (card, j)))
+                for j in range(NUM_DISCARD_PILES):
+                    end_turn.append(Move(MOVE_END_TURN, (card, j)))
+
+        for i, pile in enumerate(self.discards[player]):
+            if len(pile) == 0:
+                continue
+            value = CODE_VALUES[pile[-1]]
+            for j in range(NUM_PLAY_PILES):
+                if self.is_valid_value(value, j):
+                    from_discard.append(Move(MOVE_PLAY_DISCARD, (i, j)))
+
+        goal = self.goals[player]
+        for i in range(NUM_PLAY_PILES):
+            if goal != NO_CARD and self.is_valid_value(CODE_VALUES[goal], i):
+                from_goal.append(Move(MOVE_PLAY_GOAL, (i,)))
+
+        return (from_goal, from_hand, from_discard, end_turn)
+
+    def get_coalesced_moves(self, allowed_moves):
+        '''
+            Same as HiddenGame.get_coalesced_moves, using the compact state directly
+        '''
+        self.make_immutable()
+        player = self.current_player
+        counts = self.hands[player]
+        # kings and jokers are interchangeable
+        hand = {min(value, 13): CARD_FOR_VALUE[value] for value in range(1, NUM_CARD_VALUES + 1) if counts[value - 1] > 0}
+        discard_piles = self.discards[player]
+        discard_keys = [pile.translate(CODE_CANONICAL_VALUES) for pile in discard_piles]
+        discard_tops = [CODE_VALUES[pile[-1]] if len(pile) > 0 else 0 for pile in discard_piles]
+        goal = self.goals[player]
+        return coalesced_moves(allowed_moves, CODE_VALUES[goal] if goal != NO_CARD else 0,
+                hand, discard_keys, discard_tops, self.play_lengths)
+
+    def _play(self, code, play_pile_index):
+        '''
+            Put a card on a play pile, removing the pile if it's full
+        '''
+        length = self.play_lengths[play_pile_index]
+        play_lengths = bytearray(self.play_lengths)
+        if length + 1 == MAX_CARDS_PER_PLAY_PILE:
+            # the rest of the pile's slots are ignored, no need to clear them
+            play_lengths[play_pile_index] = 0
+        else:
+            play_buffer = bytearray(self.play_buffer)
+            play_buffer[play_pile_index * MAX_CARDS_PER_PLAY_PILE + length] = code
+            self.play_buffer = bytes(play_buffer)
+            play_lengths[play_pile_index] = length + 1
+        self.play_lengths = bytes(play_lengths)
+
+    def _remove_from_hand(self, card):
+        hand = self.hands[self.current_player]
+        if hand[card.value - 1] == 0:
+            raise RuntimeError("That card isn't in your hand!")
+        counts = bytearray(hand)
+        counts[card.value - 1] -= 1
+        self.hands = replace_item(self.hands, self.current_player, bytes(counts))
+
+    def _play_from_hand(self, card, play_pile_index):
+        if not self.is_valid_play(card, play_pile_index):
+            raise RuntimeError("Invalid play! {} on top of {}".format(card, self.play_piles[play_pile_index]))
+        self._remove_from_hand(card)
+        self._play(card_code(card), play_pile_index)
+
+    def _play_from_discard(self, discard_pile_index, play_pile_index):
+        piles = self.discards[self.current_player]
+        pile = piles[discard_pile_index]
+        if len(pile) == 0:
+            raise RuntimeError("Can't play from an empty discard pile!")
+        if not self.is_valid_value(CODE_VALUES[pile[-1]], play_pile_index):
+            raise RuntimeError("Invalid play! {} on top of {}".format(DECK[pile[-1]], self.play_piles[play_pile_index]))
+        self.discards = replace_item(self.discards, self.current_player,
+                replace_item(piles, discard_pile_index, pile[:-1]))
+        self._play(pile[-1], play_pile_index)
+
+    def _play_from_goal(self, play_pile_index):
+        code = self.goals[self.current_player]
+        if not self.is_valid_value(CODE_VALUES[code], play_pile_index):
+            raise RuntimeError("Invalid play! {} on top of {}".format(DECK[code], self.play_piles[play_pile_index]))
+        goals = bytearray(self.goals)
+        goals[self.current_player] = NO_CARD
+        self.goals = bytes(goals)
+        self._play(code, play_pile_index)
+
+    def _end_turn(self, card, discard_pile_index):
+        self._remove_from_hand(card)
+        piles = self.discards[self.current_player]
+        pile = piles[discard_pile_index] + bytes((card_code(card),))
+        self.discards = replace_item(self.discards, self.current_player,
+                replace_item(piles, discard_pile_index, pile))
+        self.current_player = (self.current_player + 1) % self.num_players
+
+    def apply(self, move):
+        '''
+            Do a move in place
+            Return a token which undo() uses to put the game back
+            The compact state is immutable, so the token is just the old state
+        '''
+        if self.winner is not None:
+            raise RuntimeError("Game is over!")
+        # edits made after copy_mutable() need to be encoded first
+        self.make_immutable()
+
+        token = (self.current_player, self.last_move, self.goals, self.hands, self.discards,
+                self.play_buffer, self.play_lengths)
+        move_list = (self._play_from_goal, self._play_from_hand, self._play_from_discard, self._end_turn)
+        move_list[move.type](*move.args)
+        self.last_move = move
+        return token
+
+    def undo(self, token):
+        '''
+            Reverse a move done with apply()
+        '''
+        (self.current_player, self.last_move, self.goals, self.hands, self.discards,
+                self.play_buffer, self.play_lengths) = token
+
+    def do_move(self, move):
+        '''
+            Do a move, returning the newly created CompactGame
+        '''
+        if self.decoded is not None:
+            raise RuntimeError("make_immutable() must be called before doing moves")
+        game = self.copy()
+        game.apply(move)
+        return game
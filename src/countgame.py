@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+'''
+    A count-based rules engine for simulating big games (lots of players and decks) quickly
+
+    Suits don't matter in spite and malice, so cards are just values (1-14) and hands are counts of
+    each value, with a bitmask of the values held. The draw pile is a deque of values, drawn from the
+    right and refilled on the left, so neither depends on how many cards are in play.
+    The deal and every shuffle use the same random numbers as Game, so a CountGame and a Game made
+    with the same seed stay identical (up to suits) for the same moves - run this file to fuzz that
+'''
+import random, argparse, time
+from collections import deque
+
+from cards import CARD_FOR_VALUE, make_decks
+from hiddengame import HiddenGame
+from game import Game, check_game_size, SEED_RANGE, NUM_DISCARD_PILES, NUM_PLAY_PILES, MAX_CARDS_PER_PLAY_PILE
+from move import *
+
+# counts are indexed by card value, so index 0 is unused
+NUM_COUNTS = 15
+WILD_MASK = (1 << 13) | (1 << 14)
+# no goal card
+NO_CARD = 0
+
+def mask_values(mask):
+    '''
+        Return the values whose bits are set in mask, lowest first
+    '''
+    values = []
+    while mask:
+        low = mask & -mask
+        values.append(low.bit_length() - 1)
+        mask ^= low
+    return values
+
+class CountGame:
+    '''
+        A Game with cards stored as values
+        Moves are the same Moves Game uses - only the value of a card argument matters
+        Everything is visible (this is for simulation, not agents), and there's no undo
+    '''
+    def __init__(self, num_players=2, num_decks=2, goal_size=13, hand_size=4, seed=None):
+        '''
+            Deal a game exactly like Game(num_players, num_decks, goal_size, hand_size, seed)
+        '''
+        check_game_size(num_players, num_decks, goal_size, hand_size)
+        self.num_players = num_players
+        self.num_decks = num_decks
+        self.goal_size = goal_size
+        self.hand_size = hand_size
+        self.winner = None
+        if seed is None:
+            seed = random.getrandbits(64)
+        seed %= SEED_RANGE
+        self.seed = seed
+        self.rng = random.Random(seed)
+
+        # shuffling values moves them the same way as shuffling Cards
+        values = [card.value for card in make_decks(num_decks)]
+        self.rng.shuffle(values)
+
+        # lists of values, drawn from the end
+        self.goal_piles = [[values.pop() for _ in range(goal_size)] for _ in range(num_players)]
+        self.hands = [[0 for _ in range(NUM_COUNTS)] for _ in range(num_players)]
+        # bit n is set if the player holds a card with value n
+        self.hand_masks = [0 for _ in range(num_players)]
+        self.hand_sizes = [0 for _ in range(num_players)]
+        for player in range(num_players):
+            for _ in range(hand_size):
+                self.add_to_hand(player, values.pop())
+        self.goal_cards = [pile.pop() for pile in self.goal_piles]
+        self.discard_piles = [[[] for _ in range(NUM_DISCARD_PILES)] for _ in range(num_players)]
+        self.play_piles = [[] for _ in range(NUM_PLAY_PILES)]
+        self.draw_pile = deque(values)
+        self.current_player = 0
+        self.last_move = None
+
+    def add_to_hand(self, player, value):
+        self.hands[player][value] += 1
+        self.hand_masks[player] |= 1 << value
+        self.hand_sizes[player] += 1
+
+    def take_from_hand(self, player, value):
+        hand = self.hands[player]
+        if hand[value] == 0:
+            raise RuntimeError("That card isn't in your hand!")
+        hand[value] -= 1
+        if hand[value] == 0:
+            self.hand_masks[player] &= ~(1 << value)
+        self.hand_sizes[player] -= 1
+
+    def get_pile_sizes(self):
+        return (tuple(len(pile) for pile in self.goal_piles), tuple(self.hand_sizes), len(self.draw_pile))
+
+    def is_valid_play(self, value, play_pile_index):
+        return value >= 13 or len(self.play_piles[play_pile_index]) + 1 == value
+
+    def is_stalemate(self):
+        return self.hand_sizes[self.current_player] == 0 and len(self.draw_pile) == 0
+
+    def fill_hand(self):
+        num_to_draw = min(self.hand_size - self.hand_sizes[self.current_player], len(self.draw_pile))
+        for _ in range(num_to_draw):
+            self.add_to_hand(self.current_player, self.draw_pile.pop())
+
+    def play(self, value, play_pile_index):
+        '''
+            Put a card on a play pile, then do everything Game.do_other_work does
+        '''
+        pile = self.play_piles[play_pile_index]
+        pile.append(value)
+        # a pile only fills up when a card is played on it
+        if len(pile) == MAX_CARDS_PER_PLAY_PILE:
+            cleared = pile[:]
+            self.rng.shuffle(cleared)
+            self.draw_pile.extendleft(reversed(cleared))
+            self.play_piles[play_pile_index] = []
+
+        player = self.current_player
+        if self.hand_sizes[player] == 0:
+            self.fill_hand()
+
+        goal_pile = self.goal_piles[player]
+        if self.goal_cards[player] == NO_CARD and len(goal_pile) > 0:
+            self.goal_cards[player] = goal_pile.pop()
+        if len(goal_pile) == 0:
+            self.winner = player
+
+    def apply(self, move):
+        '''
+            Do a move in place
+        '''
+        if self.winner is not None:
+            raise RuntimeError("Game is over!")
+        player = self.current_player
+        if move.type == MOVE_PLAY_GOAL:
+            value = self.goal_cards[player]
+            if value == NO_CARD or not self.is_valid_play(value, move.args[0]):
+                raise RuntimeError("Invalid play!")
+            self.goal_cards[player] = NO_CARD
+            self.play(value, move.args[0])
+        elif move.type == MOVE_PLAY_HAND:
+            value = move.args[0].value
+            if not self.is_valid_play(value, move.args[1]):
+                raise RuntimeError("Invalid play!")
+            self.take_from_hand(player, value)
+            self.play(value, move.args[1])
+        elif move.type == MOVE_PLAY_DISCARD:
+            pile = self.discard_piles[player][move.args[0]]
+            if len(pile) == 0 or not self.is_valid_play(pile[-1], move.args[1]):
+                raise RuntimeError("Invalid play!")
+            self.play(pile.pop(), move.args[1])
+        else:
+            value = move.args[0].value
+            self.take_from_hand(player, value)
+            self.discard_piles[player][move.args[1]].append(value)
+            self.current_player = (player + 1) % self.num_players
+            self.fill_hand()
+        self.last_move = move
+
+    def get_legal_moves(self):
+        '''
+            Return legal moves indexed by move type, like HiddenGame.get_legal_moves, but with one move
+            for each card value rather than each card
+            Plays from the hand are found from the play pile lengths and the hand's mask, so this doesn't
+            depend on the hand size
+        '''
+        player = self.current_player
+        mask = self.hand_masks[player]
+        lengths = [len(pile) for pile in self.play_piles]
+
+        from_goal = []
+        goal = self.goal_cards[player]
+        if goal != NO_CARD:
+            from_goal = [Move(MOVE_PLAY_GOAL, (i,)) for i in range(NUM_PLAY_PILES) if self.is_valid_play(goal, i)]
+
+        from_hand = []
+        for i, length in enumerate(lengths):
+            for value in mask_values(mask & ((1 << (length + 1)) | WILD_MASK)):
+                from_hand.append(Move(MOVE_PLAY_HAND, (CARD_FOR_VALUE[value], i)))
+
+        from_discard = []
+        for j, pile in enumerate(self.discard_piles[player]):
+            if len(pile) > 0:
+                from_discard += [Move(MOVE_PLAY_DISCARD, (j, i)) for i in range(NUM_PLAY_PILES)
+                        if self.is_valid_play(pile[-1], i)]
+
+        end_turn = [Move(MOVE_END_TURN, (CARD_FOR_VALUE[value], j))
+                for value in mask_values(mask) for j in range(NUM_DISCARD_PILES)]
+
+        return (from_goal, from_hand, from_discard, end_turn)
+
+def game_values(game):
+    '''
+        Return a Game or CountGame's state with cards as values, for comparing the two
+    '''
+    value = lambda card: card if isinstance(card, int) else (NO_CARD if card is None else card.value)
+    values = lambda cards: [value(card) for card in cards]
+    if isinstance(game, CountGame):
+        hands = [hand[:] for hand in game.hands]
+    else:
+        hands = [[0 for _ in range(NUM_COUNTS)] for _ in game.player_hands]
+        for hand, cards in zip(hands, game.player_hands):
+            for card in cards:
+                hand[card.value] += 1
+    return (game.current_player, game.winner, values(game.goal_cards), [values(pile) for pile in game.goal_piles],
+            hands, [[values(pile) for pile in piles] for piles in game.discard_piles],
+            [values(pile) for pile in game.play_piles], values(game.draw_pile))
+
+def random_playout(game, rng, max_moves):
+    '''
+        Play random legal moves on a CountGame (mostly cards rather than ending the turn) until the game
+        is over, yielding each move after it's applied
+    '''
+    for _ in range(max_moves):
+        if game.winner is not None or game.is_stalemate():
+            return
+        legal_moves = game.get_legal_moves()
+        moves = legal_moves[MOVE_PLAY_GOAL] + legal_moves[MOVE_PLAY_HAND] + legal_moves[MOVE_PLAY_DISCARD]
+        if len(moves) == 0 or rng.random() < 0.2:
+            moves = legal_moves[MOVE_END_TURN]
+        move = moves[rng.randrange(len(moves))]
+        game.apply(move)
+        yield move
+
+def fuzz(num_games, num_players, num_decks, goal_size, seed, max_moves):
+    '''
+        Play random games on a CountGame and a Game side by side, checking they stay the same
+        Return the moves of each game, for timing
+    '''
+    rng = random.Random(seed)
+    games = []
+    for i in range(num_games):
+        count_game = CountGame(num_players, num_decks, goal_size, seed=seed + i)
+        game = Game(num_players, num_decks, goal_size, seed=seed + i)
+        if game_values(game) != game_values(count_game):
+            raise RuntimeError("Game {} was dealt differently".format(i))
+        moves = []
+        for move in random_playout(count_game, rng, max_moves):
+            game.apply(move)
+            moves.append(move)
+            if game_values(game) != game_values(count_game):
+                raise RuntimeError("Game {} differs after move {}".format(i, len(moves)))
+        games.append(moves)
+    return games
+
+def time_moves(game_type, games, num_players, num_decks, goal_size, seed):
+    '''
+        Return the average time to generate the legal moves and apply a move, replaying games' moves
+        Game's legal moves come from a HiddenGame view, like agents get them
+    '''
+    elapsed = 0
+    num_moves = 0
+    for i, moves in enumerate(games):
+        game = game_type(num_players, num_decks, goal_size, seed=seed + i)
+        start = time.perf_counter()
+        for move in moves:
+            if game_type is Game:
+                HiddenGame(game).get_legal_moves()
+            else:
+                game.get_legal_moves()
+            game.apply(move)
+        elapsed += time.perf_counter() - start
+        num_moves += len(moves)
+    return elapsed / num_moves
+
+def main():
+    parser = argparse.ArgumentParser(description="Fuzz CountGame against Game, and time them both")
+    parser.add_argument('-n', '--num-games', type=int, default=200, dest='num_games', help='games for each size')
+    parser.add_argument('-s', '--seed', type=int, default=0)
+    parser.add_argument('--max-moves', type=int, default=2000, dest='max_moves', help='moves to play in each game')
+    args = parser.parse_args()
+
+    # (players, decks, goal size)
+    sizes = [(2, 2, 13), (4, 3, 13), (6, 4, 13)]
+    for num_players, num_decks, goal_size in sizes:
+        games = fuzz(args.num_games, num_players, num_decks, goal_size, args.seed, args.max_moves)
+        game_time = time_moves(Game, games, num_players, num_decks, goal_size, args.seed)
+        count_time = time_moves(CountGame, games, num_players, num_decks, goal_size, args.seed)
+        print('{} players, {} decks: {} moves match, Game {:.2f} us/move, CountGame {:.2f} us/move'.format(
+            num_players, num_decks, sum(len(moves) for moves in games), game_time * 1e6, count_time * 1e6))
+
+if __name__=='__main__':
+    main()
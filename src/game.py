@@ -1,27 +1,54 @@
 import random
 from copy import copy as shallow_copy
-from cards import Card, draw, draw_N, make_decks, NUM_CARDS_PER_DECK
+from cards import Card, DECK, card_code, make_decks, NUM_CARDS_PER_DECK
+from move import *
 from utils import copy_nested
 
 NUM_DISCARD_PILES=4
 NUM_PLAY_PILES=4
 MAX_CARDS_PER_PLAY_PILE=12
+# seeds are kept in this range, so they fit in 64 bits (e.g. in game logs)
+SEED_RANGE=2**64
+
+# Entries in the undo log returned by Game.apply
+UNDO_PLAY=0
+UNDO_TAKE_HAND=1
+UNDO_ADD_HAND=2
+UNDO_TAKE_DISCARD=3
+UNDO_DISCARD=4
+UNDO_GOAL=5
+UNDO_CLEAR_PLAY_PILE=6
+UNDO_EXTEND_DRAW_PILE=7
+UNDO_DRAW=8
+UNDO_CURRENT_PLAYER=9
+UNDO_WINNER=10
+UNDO_LAST_MOVE=11
+
+def check_game_size(num_players, num_decks, goal_size, hand_size):
+    '''
+        Raise an error if a game can't be played with these parameters
+    '''
+    if num_players < 2:
+        raise RuntimeError("Too few players")
+    # TODO explore how many cards are needed to ensure a game finishes - this is a rough guess
+    min_cards_needed = num_players * (goal_size + hand_size) + (MAX_CARDS_PER_PLAY_PILE + 1) * NUM_PLAY_PILES
+    if num_decks * NUM_CARDS_PER_DECK < min_cards_needed:
+        raise RuntimeError("Too few cards")
 
 class Game:
     '''
         A simulated game of spite and malice
-        Functions that progress the game return a new Game
+        do_move() returns a new Game, apply() changes the game in place and can be reversed with undo()
     '''
-    def __init__(self, num_players=2, num_decks=2, goal_size=13, hand_size=4):
+    def __init__(self, num_players=2, num_decks=2, goal_size=13, hand_size=4, seed=None):
         '''
             Create a new game, ready to play with the specified parameters
+            Everything random in the game comes from a random.Random seeded with seed, so the same seed
+            and moves always give the same game
+            If seed is None, it comes from the random module
+            Seeds are taken mod 2^64 (and self.seed is that), so any int works and fits in a game log
         '''
-        if num_players < 2:
-            raise RuntimeError("Too few players")
-        # TODO explore how many cards are needed to ensure a game finishes - this is a rough guess
-        min_cards_needed = num_players * (goal_size + hand_size) + (MAX_CARDS_PER_PLAY_PILE + 1) * NUM_PLAY_PILES
-        if num_decks * NUM_CARDS_PER_DECK < min_cards_needed:
-            raise RuntimeError("Too few cards")
+        check_game_size(num_players, num_decks, goal_size, hand_size)
 
         # constants
         self.num_players = num_players
@@ -29,17 +56,24 @@ class Game:
         self.hand_size = hand_size
         self.goal_size = goal_size
         self.winner = None
-
-        # Make a deck
+        if seed is None:
+            seed = random.getrandbits(64)
+        seed %= SEED_RANGE
+        self.seed = seed
+        # shared by copies of the game
+        self.rng = random.Random(seed)
+
+        # Make a deck and shuffle it - the order of every pile is fixed from here on
         decks = make_decks(num_decks)
+        self.rng.shuffle(decks)
 
-        #Deal!
+        #Deal! Piles are drawn from the end, which is the top
         # list of lists of Cards
-        self.goal_piles = [draw_N(decks, goal_size) for _ in range(num_players)]
+        self.goal_piles = [[decks.pop() for _ in range(goal_size)] for _ in range(num_players)]
         # list of lists of Cards
-        self.player_hands = [draw_N(decks, hand_size) for _ in range(num_players)]
+        self.player_hands = [[decks.pop() for _ in range(hand_size)] for _ in range(num_players)]
         # list of Cards
-        self.goal_cards = [draw(pile) for pile in self.goal_piles]
+        self.goal_cards = [pile.pop() for pile in self.goal_piles]
         # list of lists of lists of Cards - top card is self.discard_piles[player_index][pile_index][-1]
         self.discard_piles = [[[] for _ in range(NUM_DISCARD_PILES)] for _ in range(num_players)]
         # list of lists of Cards
@@ -47,10 +81,12 @@ class Game:
         # list of Cards
         self.draw_pile = decks
         self.current_player = 0
+        self.last_move = None
 
     def copy_mutable(self):
         '''
             Clone the game object, deep copying everything except the cards themselves
+            The clone shares the random number generator, so it carries on from where this game is
         '''
         clone = shallow_copy(self)
 
@@ -58,11 +94,30 @@ class Game:
         for attr, value in self.__dict__.items():
             if attr.startswith('__'):
                 continue
-            if isinstance(value, tuple):
+            if isinstance(value, (list, tuple)):
                 clone.__dict__[attr] = copy_nested(value)
 
         return clone
 
+    def fork(self):
+        '''
+            Clone the game with its own copy of the random number generator, so the clone plays out
+            exactly like this game would, without affecting it
+        '''
+        clone = self.copy_mutable()
+        clone.rng = random.Random()
+        clone.rng.setstate(self.rng.getstate())
+        return clone
+
+    def get_pile_sizes(self):
+        '''
+            Return the sizes of the piles whose cards can't all be seen, which everyone can see:
+            (goal pile sizes, hand sizes, draw pile size)
+            Goal pile sizes don't include the goal card on top
+        '''
+        return (tuple(len(pile) for pile in self.goal_piles), tuple(len(hand) for hand in self.player_hands),
+                len(self.draw_pile))
+
     def is_valid_play(self, card, play_pile_index):
         '''
             Check if a card can be played onto a given play pile
@@ -80,132 +135,265 @@ class Game:
             return True
         return False
 
-    def fill_hand(self):
-        num_to_draw = self.hand_size - len(self.player_hands[self.current_player])
-        self.player_hands[self.current_player] += draw_N(self.draw_pile, num_to_draw)
+    def find_card(self, cards, card):
+        '''
+            Find card in a list of cards, or failing that another card with the same value
+            Suits don't matter in spite and malice, so any card of the same value will do
+            Return None if there isn't one
+        '''
+        for other in cards:
+            if other is card:
+                return other
+        for other in cards:
+            if other.value == card.value:
+                return other
+        return None
+
+    def is_stalemate(self):
+        '''
+            Check if the game can't go on - the current player has no cards in their hand to
+            end their turn with, and there are none left to draw
+        '''
+        return len(self.player_hands[self.current_player]) == 0 and len(self.draw_pile) == 0
+
+    def _draw(self, pile, undo_log):
+        card = None
+        if len(pile) > 0:
+            card = pile.pop()
+            undo_log.append((UNDO_DRAW, pile, len(pile), card))
+        return card
+
+    def fill_hand(self, undo_log):
+        '''
+            Draw until the current player's hand is full, or the draw pile runs out
+        '''
+        num_to_draw = min(self.hand_size - len(self.player_hands[self.current_player]), len(self.draw_pile))
+        for _ in range(num_to_draw):
+            self.player_hands[self.current_player].append(self._draw(self.draw_pile, undo_log))
+            undo_log.append((UNDO_ADD_HAND, self.current_player))
 
-    def do_other_work(self):
+    def do_other_work(self, undo_log):
         '''
             Do everything that isn't shared between Game and subclasses
         '''
-        # shuffle full play piles back into deck
+        # shuffle full play piles and put them on the bottom of the deck
         for i in range(len(self.play_piles)):
             if len(self.play_piles[i]) == MAX_CARDS_PER_PLAY_PILE:
-                self.draw_pile += self.play_piles[i]
+                undo_log.append((UNDO_CLEAR_PLAY_PILE, i, self.play_piles[i]))
+                undo_log.append((UNDO_EXTEND_DRAW_PILE, len(self.play_piles[i])))
+                cleared = self.play_piles[i][:]
+                self.rng.shuffle(cleared)
+                self.draw_pile[:0] = cleared
                 self.play_piles[i] = []
 
         # restock current player's hand
         if len(self.player_hands[self.current_player]) == 0:
-            self.fill_hand()
+            self.fill_hand(undo_log)
 
         # check for winner, flip next goal card
         if self.goal_cards[self.current_player] is None \
                 and len(self.goal_piles[self.current_player]) > 0:
-            self.goal_cards[self.current_player] = draw(self.goal_piles[self.current_player])
+            undo_log.append((UNDO_GOAL, self.current_player, None))
+            self.goal_cards[self.current_player] = self._draw(self.goal_piles[self.current_player], undo_log)
 
         if len(self.goal_piles[self.current_player]) == 0:
+            undo_log.append((UNDO_WINNER, self.winner))
             self.winner = self.current_player
-    
-    def _play_from_hand(self, card, play_pile_index):
+
+    def _take_from_hand(self, card, undo_log):
+        '''
+            Remove a card (or one of the same value) from the current player's hand and return it
+        '''
+        hand = self.player_hands[self.current_player]
+        card = self.find_card(hand, card)
+        if card is None:
+            raise RuntimeError("That card isn't in your hand!")
+        for index in range(len(hand)):
+            if hand[index] is card:
+                break
+        hand.pop(index)
+        undo_log.append((UNDO_TAKE_HAND, self.current_player, index, card))
+        return card
+
+    def _play(self, card, play_pile_index, undo_log):
+        self.play_piles[play_pile_index].append(card)
+        undo_log.append((UNDO_PLAY, play_pile_index))
+
+    def _play_from_hand(self, card, play_pile_index, undo_log):
         '''
             Play a card from the current player's hand onto a play pile
-            Returns a new game state
         '''
         # validate the play
-        if card not in self.player_hands[self.current_player]:
+        if self.find_card(self.player_hands[self.current_player], card) is None:
             raise RuntimeError("Can't play that card - it's not in your hand!")
         if not self.is_valid_play(card, play_pile_index):
             raise RuntimeError("Invalid play! {} on top of {}".format(card, self.play_piles[play_pile_index]))
 
-        # Copy game
-        new_game = self.copy_mutable()
-
         # Make the play
-        new_game.play_piles[play_pile_index].append(card)
-        new_game.player_hands[new_game.current_player].remove(card)
+        card = self._take_from_hand(card, undo_log)
+        self._play(card, play_pile_index, undo_log)
 
         # Update play piles, repopulate player's hand
-        new_game.do_other_work()
-
-        return new_game
+        self.do_other_work(undo_log)
 
-    def _play_from_discard(self, discard_pile_index, play_pile_index):
+    def _play_from_discard(self, discard_pile_index, play_pile_index, undo_log):
         '''
             Play a card from one of the current player's discard piles
-            Returns a new game state
         '''
         # validate the play
-        if len(self.discard_piles[self.current_player][discard_pile_index]) == 0:
+        discard_pile = self.discard_piles[self.current_player][discard_pile_index]
+        if len(discard_pile) == 0:
             raise RuntimeError("Can't play from an empty discard pile!")
-        card = self.discard_piles[self.current_player][discard_pile_index][-1]
+        card = discard_pile[-1]
         if not self.is_valid_play(card, play_pile_index):
             raise RuntimeError("Invalid play! {} on top of {}".format(card, self.play_piles[play_pile_index]))
 
-        # Copy game
-        new_game = self.copy_mutable()
-
         # Make the play
-        new_game.play_piles[play_pile_index].append(card)
-        new_game.discard_piles[new_game.current_player][discard_pile_index].pop()
+        discard_pile.pop()
+        undo_log.append((UNDO_TAKE_DISCARD, self.current_player, discard_pile_index, card))
+        self._play(card, play_pile_index, undo_log)
 
         # Update play piles
-        new_game.do_other_work()
+        self.do_other_work(undo_log)
 
-        return new_game
-
-    def _play_from_goal(self, play_pile_index):
+    def _play_from_goal(self, play_pile_index, undo_log):
         '''
             Play the current player's goal card
-            Returns a new game state
         '''
         # validate the play
         card = self.goal_cards[self.current_player]
         if not self.is_valid_play(card, play_pile_index):
             raise RuntimeError("Invalid play! {} on top of {}".format(card, self.play_piles[play_pile_index]))
 
-        # Copy game
-        new_game = self.copy_mutable()
-
         # Make the play
-        new_game.play_piles[play_pile_index].append(card)
-        new_game.goal_cards[new_game.current_player] = None
-        
-        # Check play piles, flip next goal card
-        new_game.do_other_work()
+        undo_log.append((UNDO_GOAL, self.current_player, card))
+        self.goal_cards[self.current_player] = None
+        self._play(card, play_pile_index, undo_log)
 
-        return new_game
+        # Check play piles, flip next goal card
+        self.do_other_work(undo_log)
 
-    def _end_turn(self, card, discard_pile_index):
+    def _end_turn(self, card, discard_pile_index, undo_log):
         '''
             End the current player's turn, discarding one card from their hand
-            Returns a new game state
         '''
         # check the card is in their hand
-        if card not in self.player_hands[self.current_player]:
+        if self.find_card(self.player_hands[self.current_player], card) is None:
             raise RuntimeError("Can't discard that card - it's not in your hand!")
 
-        # Copy the game
-        new_game = self.copy_mutable()
-        
         # discard the card
-        new_game.discard_piles[new_game.current_player][discard_pile_index].append(card)
-        new_game.player_hands[new_game.current_player].remove(card)
-        
+        card = self._take_from_hand(card, undo_log)
+        self.discard_piles[self.current_player][discard_pile_index].append(card)
+        undo_log.append((UNDO_DISCARD, self.current_player, discard_pile_index))
+
         # Advance to the next player
-        new_game.current_player = (new_game.current_player + 1) % new_game.num_players
+        undo_log.append((UNDO_CURRENT_PLAYER, self.current_player))
+        self.current_player = (self.current_player + 1) % self.num_players
 
         # Next player draws until their hand is full
-        new_game.fill_hand()
+        self.fill_hand(undo_log)
 
-        return new_game
+    def apply(self, move):
+        '''
+            Do a move in place
+            Return a token (a list of changes, oldest first) which undo() uses to put the game back
+            The game's piles must be lists, see copy_mutable()
+        '''
+        if self.winner is not None:
+            raise RuntimeError("Game is over!")
+
+        undo_log = [(UNDO_LAST_MOVE, self.last_move)]
+        move_list = (self._play_from_goal, self._play_from_hand, self._play_from_discard, self._end_turn)
+        move_list[move.type](*move.args, undo_log)
+        self.last_move = move
+        return undo_log
+
+    def undo(self, token):
+        '''
+            Reverse a move done with apply()
+            Moves must be undone in the reverse order they were applied
+            The random number generator isn't rewound, so a cleared play pile may be shuffled
+            differently if the move is done again
+        '''
+        for change in reversed(token):
+            kind = change[0]
+            if kind == UNDO_PLAY:
+                self.play_piles[change[1]].pop()
+            elif kind == UNDO_TAKE_HAND:
+                self.player_hands[change[1]].insert(change[2], change[3])
+            elif kind == UNDO_ADD_HAND:
+                self.player_hands[change[1]].pop()
+            elif kind == UNDO_TAKE_DISCARD:
+                self.discard_piles[change[1]][change[2]].append(change[3])
+            elif kind == UNDO_DISCARD:
+                self.discard_piles[change[1]][change[2]].pop()
+            elif kind == UNDO_GOAL:
+                self.goal_cards[change[1]] = change[2]
+            elif kind == UNDO_CLEAR_PLAY_PILE:
+                self.play_piles[change[1]] = change[2]
+            elif kind == UNDO_EXTEND_DRAW_PILE:
+                del self.draw_pile[:change[1]]
+            elif kind == UNDO_DRAW:
+                change[1].insert(change[2], change[3])
+            elif kind == UNDO_CURRENT_PLAYER:
+                self.current_player = change[1]
+            elif kind == UNDO_WINNER:
+                self.winner = change[1]
+            elif kind == UNDO_LAST_MOVE:
+                self.last_move = change[1]
+            else:
+                raise RuntimeError("Invalid undo entry {}".format(change))
 
     def do_move(self, move):
         '''
             Do a move supplied as a tuple (move_id, args)
             return the newly created Game
         '''
-        if self.winner is not None:
-            raise RuntimeError("Game is over!")
+        new_game = self.copy_mutable()
+        new_game.apply(move)
+        return new_game
 
-        move_list = (self._play_from_goal, self._play_from_hand, self._play_from_discard, self._end_turn)
-        return move_list[move.type](*move.args)
+def game_to_dict(game):
+    '''
+        Convert a Game to something that can be stored as JSON, with cards as card codes
+    '''
+    encode = lambda cards: [card_code(card) for card in cards]
+    return {
+            'num_players': game.num_players,
+            'num_decks': game.num_decks,
+            'goal_size': game.goal_size,
+            'hand_size': game.hand_size,
+            'current_player': game.current_player,
+            'winner': game.winner,
+            'goal_piles': [encode(pile) for pile in game.goal_piles],
+            'player_hands': [encode(hand) for hand in game.player_hands],
+            'goal_cards': [None if card is None else card_code(card) for card in game.goal_cards],
+            'discard_piles': [[encode(pile) for pile in piles] for piles in game.discard_piles],
+            'play_piles': [encode(pile) for pile in game.play_piles],
+            'draw_pile': encode(game.draw_pile),
+            }
+
+def game_from_dict(data):
+    '''
+        Make a Game from game_to_dict's output
+    '''
+    decode = lambda codes: [DECK[code] for code in codes]
+    # don't deal a new game
+    game = Game.__new__(Game)
+    game.num_players = data['num_players']
+    game.num_decks = data['num_decks']
+    game.goal_size = data['goal_size']
+    game.hand_size = data['hand_size']
+    game.current_player = data['current_player']
+    game.winner = data.get('winner')
+    game.last_move = None
+    # positions don't record the state of the game's random numbers, so draws start from seed
+    game.seed = data.get('seed')
+    game.rng = random.Random(game.seed)
+    game.goal_piles = [decode(pile) for pile in data['goal_piles']]
+    game.player_hands = [decode(hand) for hand in data['player_hands']]
+    game.goal_cards = [None if code is None else DECK[code] for code in data['goal_cards']]
+    game.discard_piles = [[decode(pile) for pile in piles] for piles in data['discard_piles']]
+    game.play_piles = [decode(pile) for pile in data['play_piles']]
+    game.draw_pile = decode(data['draw_pile'])
+    return game
@@ -0,0 +1,182 @@
+'''
+    Compact binary logs of games, so they can be replayed and analyzed later
+
+    A log file is any number of game records one after the other, so games can be appended forever
+    Each record is a fixed size header followed by a fixed size entry for each move:
+        header: magic, version, num_players, num_decks, goal_size, hand_size, winner, num_moves, seed
+        move: type, then two args - card codes, or discard or play pile indices
+    Games are replayed from the seed, since the Game's random numbers all come from it
+    The header says how many moves there are, so reading game N only needs the headers before it
+'''
+import os, mmap, struct
+
+from cards import DECK, card_code
+from game import Game
+from replay import Replay
+from move import *
+
+MAGIC = b'SMGL'
+VERSION = 1
+HEADER = struct.Struct('<4sBBBBBbIQ')
+MOVE = struct.Struct('<BBB')
+# winner of a game that ended in a stalemate
+NO_WINNER = -1
+# winner and number of moves of a game that hasn't been finished (e.g. the writer crashed)
+UNFINISHED = -2
+UNKNOWN_NUM_MOVES = 0xffffffff
+# where the winner is in the header
+WINNER_OFFSET = 9
+
+def encode_move(move):
+    '''
+        Return a move's (type, arg, arg) as small ints
+    '''
+    if move.type == MOVE_PLAY_GOAL:
+        return (move.type, move.args[0], 0)
+    if move.type == MOVE_PLAY_HAND:
+        return (move.type, card_code(move.args[0]), move.args[1])
+    if move.type == MOVE_PLAY_DISCARD:
+        return (move.type, move.args[0], move.args[1])
+    if move.type == MOVE_END_TURN:
+        return (move.type, card_code(move.args[0]), move.args[1])
+    raise RuntimeError("Invalid move type!")
+
+def decode_move(move_type, a, b):
+    if move_type == MOVE_PLAY_GOAL:
+        return Move(move_type, (a,))
+    if move_type == MOVE_PLAY_HAND or move_type == MOVE_END_TURN:
+        return Move(move_type, (DECK[a], b))
+    return Move(move_type, (a, b))
+
+class GameLogWriter:
+    '''
+        Streams games to the end of a log
+        f is a binary file opened for reading and writing (so the header can be filled in when the
+        game ends), or a path, which is created if needed and appended to
+    '''
+    def __init__(self, f):
+        self.owns_file = not hasattr(f, 'write')
+        if self.owns_file:
+            f = open(f, 'r+b' if os.path.exists(f) else 'w+b')
+        self.f = f
+        self.f.seek(0, os.SEEK_END)
+        self.header_offset = None
+        self.num_moves = 0
+
+    def start_game(self, game):
+        '''
+            Start a record for game, which must be a new Game
+        '''
+        if self.header_offset is not None:
+            raise RuntimeError("The last game wasn't ended")
+        self.header_offset = self.f.tell()
+        self.num_moves = 0
+        self.f.write(HEADER.pack(MAGIC, VERSION, game.num_players, game.num_decks, game.goal_size,
+            game.hand_size, UNFINISHED, UNKNOWN_NUM_MOVES, game.seed))
+
+    def write_move(self, move):
+        self.f.write(MOVE.pack(*encode_move(move)))
+        self.num_moves += 1
+
+    def end_game(self, winner):
+        '''
+            Fill in the winner (None for a stalemate) and number of moves
+        '''
+        end = self.f.tell()
+        self.f.seek(self.header_offset + WINNER_OFFSET)
+        self.f.write(struct.pack('<bI', NO_WINNER if winner is None else winner, self.num_moves))
+        self.f.seek(end)
+        self.f.flush()
+        self.header_offset = None
+
+    def close(self):
+        if self.owns_file:
+            self.f.close()
+
+class GameLogReader:
+    '''
+        Random access to the games in a log, which is memory mapped rather than read in
+        Games are numbered from 0 in the order they were written
+        An unfinished game is assumed to run to the end of the file, so it can only be the last one
+    '''
+    def __init__(self, path):
+        self.f = open(path, 'rb')
+        size = os.fstat(self.f.fileno()).st_size
+        self.data = mmap.mmap(self.f.fileno(), 0, access=mmap.ACCESS_READ) if size > 0 else b''
+        # offset of each game's header, found by hopping from header to header
+        self.offsets = []
+        offset = 0
+        while offset + HEADER.size <= len(self.data):
+            self.offsets.append(offset)
+            num_moves = self.get_header(len(self.offsets) - 1)['num_moves']
+            offset += HEADER.size + num_moves * MOVE.size
+
+    def close(self):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+        self.f.close()
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def get_header(self, n):
+        '''
+            Return game n's header as a dict
+            An unfinished game has winner UNFINISHED, and however many moves made it into the file
+        '''
+        offset = self.offsets[n]
+        magic, version, num_players, num_decks, goal_size, hand_size, winner, num_moves, seed = \
+                HEADER.unpack_from(self.data, offset)
+        if magic != MAGIC or version != VERSION:
+            raise RuntimeError("Game {} isn't a version {} game log record".format(n, VERSION))
+        if num_moves == UNKNOWN_NUM_MOVES:
+            num_moves = (len(self.data) - offset - HEADER.size) // MOVE.size
+        return {
+                'num_players': num_players,
+                'num_decks': num_decks,
+                'goal_size': goal_size,
+                'hand_size': hand_size,
+                'winner': None if winner == NO_WINNER else winner,
+                'num_moves': num_moves,
+                'seed': seed,
+                }
+
+    def get_moves(self, n):
+        '''
+            Return a list of game n's Moves
+        '''
+        start = self.offsets[n] + HEADER.size
+        num_moves = self.get_header(n)['num_moves']
+        return [decode_move(*entry) for entry in MOVE.iter_unpack(self.data[start:start + num_moves * MOVE.size])]
+
+    def new_game(self, n):
+        '''
+            Return game n as it was dealt
+        '''
+        header = self.get_header(n)
+        return Game(num_players=header['num_players'], num_decks=header['num_decks'],
+                goal_size=header['goal_size'], hand_size=header['hand_size'], seed=header['seed'])
+
+    def iter_states(self, n):
+        '''
+            Replay game n, yielding (move, game) after each move - the same Game is changed in place
+        '''
+        game = self.new_game(n)
+        for move in self.get_moves(n):
+            game.apply(move)
+            yield move, game
+
+    def replay(self, n):
+        '''
+            Return a Replay of game n, for seeking around it
+        '''
+        header = self.get_header(n)
+        return Replay(self.get_moves(n), header['seed'], num_players=header['num_players'],
+                num_decks=header['num_decks'], goal_size=header['goal_size'], hand_size=header['hand_size'])
+
+    def get_state(self, n, num_moves):
+        '''
+            Return game n after num_moves moves
+            To look at more than one state of a game, use replay() so the checkpoints are kept
+        '''
+        return self.replay(n).get_state(num_moves)
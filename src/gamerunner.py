@@ -1,46 +1,151 @@
 from hiddengame import HiddenGame
-import time
+from game import game_to_dict
+from move import MOVE_END_TURN
+from searchstats import SearchStats, StreamingStats, NULL_STATS
+from beliefs import notify_agents
+import time, json
 
 class GameRunner:
     '''
         Class for running and collecting information about a Game
     '''
-    def __init__(self, game, agents, verbose=True):
+    def __init__(self, game, agents, verbose=True, view_type=HiddenGame, collect_stats=False, profiler=None,
+            log=None):
+        '''
+            view_type is the class used to show the game to agents, e.g. HiddenGame or CompactGame
+            If collect_stats is True, agents with a stats attribute get a SearchStats for each move
+            profiler is an optional SlowMoveProfiler - slow moves are recorded with their profile and position
+            log is an optional GameLogWriter the game's moves are written to, in which case game must be a new Game
+        '''
         if game.num_players != len(agents):
             raise RuntimeError("Wrong number of agents!")
         self.game = game
         self.agents = agents
         self.verbose = verbose
-        self.agent_move_times = [[] for _ in agents]
+        self.view_type = view_type
+        self.collect_stats = collect_stats
+        self.profiler = profiler
+        self.log = log
+        # move times are aggregated as they come in, rather than kept
+        self.agent_move_times = [StreamingStats() for _ in agents]
+        self.num_turns = 1
+        self.num_moves = 0
+        # a dict of player, time and search counters for each move, if collect_stats is True
+        self.move_stats = []
+        # a dict of player, time, position and profile for each move slower than the profiler's threshold
+        self.slow_moves = []
     
     def v_print(self, string):
         if self.verbose:
             print(string)
 
     def get_avg_move_times(self):
-        return [sum(times)/len(times) for time in self.agent_move_times]
+        '''
+            Return each agent's average move time, or None for agents which haven't moved
+        '''
+        return [times.mean if times.count > 0 else None for times in self.agent_move_times]
 
     def get_longest_move_times(self):
-        return [max(times) for times in self.agent_move_times]
+        return [times.max for times in self.agent_move_times]
+
+    def get_summary(self, num_slowest=5):
+        '''
+            Summarize the game as something that can be stored as JSON:
+            the result, move times and search counters for each agent, and the slowest moves
+        '''
+        agents = []
+        for player, agent in enumerate(self.agents):
+            times = self.agent_move_times[player]
+            totals = {}
+            peaks = {}
+            for stats in self.move_stats:
+                if stats['player'] != player:
+                    continue
+                for name, value in stats['counters'].items():
+                    totals[name] = totals.get(name, 0) + value
+                    peaks[name] = max(peaks.get(name, 0), value)
+            agents.append({
+                'name': getattr(agent, 'name', type(agent).__name__),
+                'num_moves': times.count,
+                'total_time': times.total,
+                'longest_time': times.max if times.count > 0 else 0,
+                'move_times': times.summary(),
+                'totals': totals,
+                'peaks': peaks,
+                })
+        return {
+                'winner': self.game.winner,
+                'num_turns': self.num_turns,
+                'num_moves': self.num_moves,
+                'agents': agents,
+                'slowest_moves': sorted(self.move_stats, key=lambda stats: stats['time'], reverse=True)[:num_slowest],
+                'slow_moves': self.slow_moves,
+                }
+
+    def export_summary(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.get_summary(), f, indent=1)
 
     def play(self):
+        '''
+            Play until someone wins, and return the winner
+            Return None if the game ends in a stalemate
+        '''
+        if self.log is not None:
+            self.log.start_game(self.game)
+        winner = self.play_moves()
+        if self.log is not None:
+            self.log.end_game(winner)
+        return winner
+
+    def play_moves(self):
         while True:
+            if self.game.is_stalemate():
+                self.v_print("Nobody can win - stalemate!")
+                return None
+
             # get the current agent, and ask it what move it wants to do
-            agent = self.agents[self.game.current_player]
-            hg = HiddenGame(self.game)
+            player = self.game.current_player
+            agent = self.agents[player]
+            hg = self.view_type(self.game)
+
+            stats = None
+            if self.collect_stats and hasattr(agent, 'stats'):
+                stats = SearchStats()
+                agent.stats = stats
+            if self.profiler is not None:
+                self.profiler.start()
 
             start_time = time.perf_counter()
             # Do the move
             move = agent.get_move(hg)
             # record how long it took
-            self.agent_move_times[self.game.current_player].append(time.perf_counter() - start_time)
+            elapsed = time.perf_counter() - start_time
+            self.agent_move_times[player].add(elapsed)
+
+            if self.profiler is not None:
+                report = self.profiler.stop(elapsed)
+                if report is not None:
+                    self.slow_moves.append({'move': self.num_moves, 'player': player, 'time': elapsed,
+                        'position': game_to_dict(self.game), 'profile': report})
+            if stats is not None:
+                agent.stats = NULL_STATS
+                self.move_stats.append({'move': self.num_moves, 'player': player, 'time': elapsed,
+                    'counters': stats.counters})
 
-            self.v_print("Player {} => {}".format(self.game.current_player, move.repr(hg)))
-            self.v_print("=========================================================")
-            # now actually do the move
-            self.game = self.game.do_move(move)
+            if self.verbose:
+                print("Player {} => {}".format(player, move.repr(hg)))
+                print("=========================================================")
+            # now actually do the move, and tell the agents what they saw
+            self.game = self.game.copy_mutable()
+            notify_agents(self.agents, self.game.apply(move))
+            if self.log is not None:
+                self.log.write_move(move)
+            self.num_moves += 1
+            if move.type == MOVE_END_TURN:
+                self.num_turns += 1
             # stop as soon as there is a winner
             if self.game.winner is not None:
                 self.v_print ("Player {} won the game!".format(self.game.current_player))
                 return self.game.winner
-            #sleep(0.5)
\ No newline at end of file
+            #sleep(0.5)
@@ -0,0 +1,366 @@
+#!/usr/bin/env python3
+'''
+    An asyncio server which hosts lots of games at once for human and bot players, over TCP or a Unix socket
+
+    The protocol is one message per line, with words separated by spaces. Clients send:
+        NEW <seat> <seat> ... [seed=N] [goal=N]     make a table, with each seat human, basic, random or montecarlo
+        JOIN <table>                                sit in the table's first free human seat
+        WATCH <table>                               see the table's moves without playing
+        MOVE <table> <option>                       choose one of the options offered for your turn
+        QUIT
+    and the server sends:
+        TABLE <table>                               the table that was made - you're watching it
+        SEAT <table> <seat>                         the seat you're in
+        START <table> <seed>                        every human seat is taken, so play has started
+        TURN <table> <view>                         it's your turn - view is what you can see, as JSON with card codes
+        OPTION <table> <option> <description>       one for each legal move, after TURN
+        MOVED <table> <player> <type> <arg> <arg>   a move was played (encoded as in gamelog.encode_move)
+        TIMEOUT <table> <player>                    a player took too long, so a greedy move was played for them
+        END <table> <winner>                        the game is over - winner is -1 for a stalemate
+        ERROR <message>
+    Bots search in a pool of worker processes, so the event loop is never blocked by a search
+    Every move has a time limit, after which montecarloagent.rollout_move picks one instead
+'''
+import asyncio, argparse, json, os, traceback
+from concurrent.futures import ProcessPoolExecutor
+
+from game import Game, check_game_size
+from hiddengame import HiddenGame
+from basicagent import BasicAgent
+from randomagent import RandomAgent
+from montecarloagent import MonteCarloAgent, rollout_move
+from cards import card_code
+from gamelog import encode_move
+
+HUMAN = 'human'
+AGENT_TYPES = {
+        'basic': BasicAgent,
+        'random': RandomAgent,
+        'montecarlo': MonteCarloAgent,
+        }
+DEFAULT_GOAL_SIZE = 10
+# tables are dealt with Game's default number of decks and hand size
+DEFAULT_NUM_DECKS = 2
+DEFAULT_HAND_SIZE = 4
+MAX_SEATS = 255
+MAX_GOAL_SIZE = 255
+DEFAULT_MOVE_TIMEOUT = 60
+DEFAULT_BOT_TIMEOUT = 5
+DEFAULT_MAX_TABLES = 1000
+
+# agents made in this worker process, by name
+# they keep nothing from one turn to the next except caches, so all tables share them
+worker_agents = {}
+
+def find_bot_path(agent_name, agent_args, hg):
+    '''
+        Run in a worker process: return the path (in reverse order) the agent would play from hg
+    '''
+    agent = worker_agents.get(agent_name)
+    if agent is None:
+        agent = worker_agents[agent_name] = AGENT_TYPES[agent_name](**agent_args)
+    agent.new_game()
+    agent.new_search()
+    return agent.choose_path_from_book(hg)
+
+def view_to_dict(hg):
+    '''
+        Everything the current player can see, with cards as card codes
+    '''
+    encode = lambda cards: [card_code(card) for card in cards]
+    goal_pile_sizes, hand_sizes, draw_pile_size = hg.get_pile_sizes()
+    return {
+            'current_player': hg.current_player,
+            'goal_cards': [None if card is None else card_code(card) for card in hg.goal_cards],
+            'hand': encode(hg.player_hands[hg.current_player]),
+            'discard_piles': [[encode(pile) for pile in piles] for piles in hg.discard_piles],
+            'play_piles': [encode(pile) for pile in hg.play_piles],
+            'goal_pile_sizes': goal_pile_sizes,
+            'hand_sizes': hand_sizes,
+            'draw_pile_size': draw_pile_size,
+            }
+
+class Connection:
+    '''
+        A client, which can be playing at or watching any number of tables
+    '''
+    def __init__(self, writer):
+        self.writer = writer
+        self.tables = set()
+
+    def send(self, *words):
+        if not self.writer.is_closing():
+            self.writer.write((' '.join(str(word) for word in words) + '\n').encode())
+
+class Table:
+    '''
+        One game, and who is playing and watching it
+    '''
+    def __init__(self, table_id, seats, seed, goal_size):
+        self.id = table_id
+        self.seats = seats
+        self.seed = seed
+        self.game = Game(num_players=len(seats), goal_size=goal_size, seed=seed)
+        # connection of the player in each human seat
+        self.players = [None for _ in seats]
+        self.free_seats = [i for i, seat in enumerate(seats) if seat == HUMAN]
+        self.watchers = set()
+        # the rest of each bot's path for this turn, in reverse order
+        self.paths = [[] for _ in seats]
+        # (player, legal moves, future) while waiting for a human to move
+        self.waiting = None
+        self.ready = asyncio.Event()
+        if len(self.free_seats) == 0:
+            self.ready.set()
+        self.task = None
+
+    def broadcast(self, *words):
+        for connection in self.watchers:
+            connection.send(*words)
+
+class GameServer:
+    '''
+        Hosts tables and plays their games, each in its own task
+    '''
+    def __init__(self, pool, agent_args, move_timeout=DEFAULT_MOVE_TIMEOUT, bot_timeout=DEFAULT_BOT_TIMEOUT,
+            max_tables=DEFAULT_MAX_TABLES):
+        '''
+            Bots are made with agent_args and search in pool, a concurrent.futures executor
+            Humans get move_timeout seconds for each move and bots get bot_timeout seconds for each path
+        '''
+        self.pool = pool
+        self.agent_args = agent_args
+        self.move_timeout = move_timeout
+        self.bot_timeout = bot_timeout
+        self.max_tables = max_tables
+        self.tables = {}
+        self.next_table_id = 0
+
+    async def handle_connection(self, reader, writer):
+        connection = Connection(writer)
+        try:
+            while True:
+                line = await reader.readline()
+                if len(line) == 0:
+                    break
+                words = line.decode(errors='replace').split()
+                if len(words) == 0:
+                    continue
+                if words[0] == 'QUIT':
+                    break
+                try:
+                    self.handle_message(connection, words)
+                except (RuntimeError, ValueError) as e:
+                    connection.send('ERROR', e)
+                except Exception as e:
+                    # whatever a client sends, the connection keeps going
+                    connection.send('ERROR', 'Bad message: {}'.format(e))
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self.disconnect(connection)
+            writer.close()
+
+    def get_table(self, table_id):
+        table = self.tables.get(int(table_id))
+        if table is None:
+            raise RuntimeError("No table {}".format(table_id))
+        return table
+
+    def handle_message(self, connection, words):
+        command, args = words[0], words[1:]
+        if command == 'NEW':
+            self.new_table(connection, args)
+        elif command == 'JOIN' and len(args) == 1:
+            table = self.get_table(args[0])
+            if len(table.free_seats) == 0:
+                raise RuntimeError("Table {} has no free seats".format(table.id))
+            seat = table.free_seats.pop(0)
+            table.players[seat] = connection
+            table.watchers.add(connection)
+            connection.tables.add(table)
+            connection.send('SEAT', table.id, seat)
+            if len(table.free_seats) == 0:
+                table.ready.set()
+        elif command == 'WATCH' and len(args) == 1:
+            table = self.get_table(args[0])
+            table.watchers.add(connection)
+            connection.tables.add(table)
+        elif command == 'MOVE' and len(args) == 2:
+            table = self.get_table(args[0])
+            if table.waiting is None or table.players[table.waiting[0]] is not connection:
+                raise RuntimeError("It isn't your turn at table {}".format(table.id))
+            player, legal_moves, future = table.waiting
+            option = int(args[1])
+            if option not in range(len(legal_moves)):
+                raise RuntimeError("No option {}".format(option))
+            if not future.done():
+                future.set_result(legal_moves[option])
+        else:
+            raise RuntimeError("Unknown message {}".format(' '.join(words)))
+
+    def new_table(self, connection, args):
+        if len(self.tables) >= self.max_tables:
+            raise RuntimeError("Too many tables")
+        seats = []
+        seed = None
+        goal_size = DEFAULT_GOAL_SIZE
+        for arg in args:
+            if arg.startswith('seed='):
+                seed = int(arg[len('seed='):])
+            elif arg.startswith('goal='):
+                goal_size = int(arg[len('goal='):])
+            elif arg == HUMAN or arg in AGENT_TYPES:
+                seats.append(arg)
+            else:
+                raise RuntimeError("Unknown seat {}".format(arg))
+        # game logs store these in a byte each
+        if not 2 <= len(seats) <= MAX_SEATS:
+            raise RuntimeError("A table needs 2 to {} seats".format(MAX_SEATS))
+        if not 1 <= goal_size <= MAX_GOAL_SIZE:
+            raise RuntimeError("goal must be 1 to {}".format(MAX_GOAL_SIZE))
+        check_game_size(len(seats), DEFAULT_NUM_DECKS, goal_size, DEFAULT_HAND_SIZE)
+        # the game is dealt from seed, so it can be replayed
+        if seed is None:
+            seed = int.from_bytes(os.urandom(8), 'little')
+        try:
+            table = Table(self.next_table_id, seats, seed, goal_size)
+        except Exception as e:
+            raise RuntimeError("Can't make the table: {}".format(e))
+        self.next_table_id += 1
+        self.tables[table.id] = table
+        table.watchers.add(connection)
+        connection.tables.add(table)
+        connection.send('TABLE', table.id)
+        table.task = asyncio.create_task(self.play(table))
+
+    def disconnect(self, connection):
+        '''
+            Stop sending to connection - its seats are kept, but moves are chosen for them straight away
+            Tables which haven't started and have nobody sitting at or watching them are closed
+        '''
+        for table in connection.tables:
+            table.watchers.discard(connection)
+            for seat, player in enumerate(table.players):
+                if player is connection:
+                    table.players[seat] = None
+                    if not table.ready.is_set():
+                        table.free_seats.append(seat)
+                        table.free_seats.sort()
+            if table.waiting is not None and table.players[table.waiting[0]] is None \
+                    and not table.waiting[2].done():
+                table.waiting[2].set_result(None)
+            if not table.ready.is_set() and len(table.watchers) == 0 \
+                    and all(player is None for player in table.players):
+                # nobody is left to start the game, so don't keep the table waiting forever
+                table.task.cancel()
+                del self.tables[table.id]
+        connection.tables.clear()
+
+    async def get_human_move(self, table, player, hg):
+        legal_moves = [move for moves in hg.get_legal_moves() for move in moves]
+        connection = table.players[player]
+        move = None
+        if connection is not None:
+            future = asyncio.get_running_loop().create_future()
+            table.waiting = (player, legal_moves, future)
+            connection.send('TURN', table.id, json.dumps(view_to_dict(hg), separators=(',', ':')))
+            for i, legal_move in enumerate(legal_moves):
+                connection.send('OPTION', table.id, i, legal_move.repr(hg))
+            try:
+                move = await asyncio.wait_for(future, self.move_timeout)
+            except asyncio.TimeoutError:
+                pass
+            table.waiting = None
+        if move is None:
+            table.broadcast('TIMEOUT', table.id, player)
+            move = rollout_move(hg)
+        return move
+
+    async def get_bot_move(self, table, player, hg):
+        path = table.paths[player]
+        if len(path) == 0:
+            # the view is pickled later by another thread, and the game changes if the search times out,
+            # so send a copy
+            try:
+                search = asyncio.get_running_loop().run_in_executor(self.pool, find_bot_path, table.seats[player],
+                        self.agent_args, hg.copy_mutable())
+                path = await asyncio.wait_for(search, self.bot_timeout)
+            except asyncio.TimeoutError:
+                # the search carries on in its worker, but its path is thrown away
+                table.broadcast('TIMEOUT', table.id, player)
+                path = [rollout_move(hg)]
+            except Exception as e:
+                # e.g. the search raised, or the pool broke - the game goes on with a greedy move
+                table.broadcast('ERROR', 'Search for player {} at table {} failed: {!r}'.format(player, table.id, e))
+                path = [rollout_move(hg)]
+            table.paths[player] = path
+        return path.pop()
+
+    async def play(self, table):
+        '''
+            Play the table's game once everyone has sat down, then close the table
+            The table is closed however play ends - if the game breaks, watchers get ERROR then END -1
+        '''
+        winner = None
+        try:
+            await table.ready.wait()
+            table.broadcast('START', table.id, table.seed)
+            game = table.game
+            while not game.is_stalemate():
+                player = game.current_player
+                hg = HiddenGame(game)
+                if table.seats[player] == HUMAN:
+                    move = await self.get_human_move(table, player, hg)
+                else:
+                    move = await self.get_bot_move(table, player, hg)
+                game.apply(move)
+                table.broadcast('MOVED', table.id, player, *encode_move(move))
+                if game.winner is not None:
+                    break
+            winner = game.winner
+        except Exception as e:
+            traceback.print_exc()
+            table.broadcast('ERROR', 'Table {} stopped: {!r}'.format(table.id, e))
+        finally:
+            table.broadcast('END', table.id, -1 if winner is None else winner)
+            for connection in table.watchers:
+                connection.tables.discard(table)
+            # disconnect() may have removed a table that never started already
+            self.tables.pop(table.id, None)
+
+async def serve(args):
+    agent_args = {'max_move_ms': args.max_move_ms or None, 'max_nodes': args.max_nodes}
+    with ProcessPoolExecutor(args.workers) as pool:
+        server = GameServer(pool, agent_args, args.move_timeout, args.bot_timeout, args.max_tables)
+        if args.unix is not None:
+            listener = await asyncio.start_unix_server(server.handle_connection, path=args.unix)
+            print('Serving on {}'.format(args.unix))
+        else:
+            listener = await asyncio.start_server(server.handle_connection, args.host, args.port)
+            print('Serving on {}:{}'.format(args.host, args.port))
+        async with listener:
+            await listener.serve_forever()
+
+def main():
+    parser = argparse.ArgumentParser(description="Host games for human and bot players")
+    parser.add_argument('--host', default='127.0.0.1', help='address to listen on')
+    parser.add_argument('-p', '--port', type=int, default=7777, help='TCP port to listen on')
+    parser.add_argument('--unix', default=None, metavar='PATH', help='listen on a Unix socket instead of TCP')
+    parser.add_argument('-w', '--workers', type=int, default=os.cpu_count(), help='number of processes bots search in')
+    parser.add_argument('--max-move-ms', type=int, default=200, dest='max_move_ms',
+            help='time budget for each bot search in ms (0 for no limit)')
+    parser.add_argument('--max-nodes', type=int, default=None, dest='max_nodes',
+            help='limit on states bots expand for each move')
+    parser.add_argument('--move-timeout', type=float, default=DEFAULT_MOVE_TIMEOUT, dest='move_timeout',
+            help='seconds a human has to choose each move')
+    parser.add_argument('--bot-timeout', type=float, default=DEFAULT_BOT_TIMEOUT, dest='bot_timeout',
+            help='seconds a bot has to find each path, including waiting for a free worker')
+    parser.add_argument('--max-tables', type=int, default=DEFAULT_MAX_TABLES, dest='max_tables',
+            help='most tables open at once')
+    args = parser.parse_args()
+    asyncio.run(serve(args))
+
+if __name__=='__main__':
+    main()
@@ -1,4 +1,6 @@
 from game import *
+from cards import canonical_value
+from movegen import coalesced_moves
 from utils import copy_nested
 from move import *
 
@@ -6,6 +8,11 @@ class HiddenGame(Game):
     '''
         A class representing a Game from one player's perspective
         Information that player shouldn't be able to see isn't present
+        Making a view doesn't copy any cards: it shares the game's piles, with other players' hands masked,
+        until the view itself is changed - so the game mustn't be changed while the view is in use
+        (GameRunner plays each move on a new copy of the game)
+        The first apply() gives the view its own copy of the piles, and copy_mutable() returns a copy
+        which doesn't share anything with the game
     '''
     def __init__(self, game):
 
@@ -16,27 +23,76 @@ class HiddenGame(Game):
 
         self.current_player = game.current_player
         self.winner = game.winner
-        self.goal_cards = game.goal_cards[:]
-        self.discard_piles = copy_nested(game.discard_piles)
-        self.play_piles = copy_nested(game.play_piles)
+        # shared with game until the view is changed
+        self.goal_cards = game.goal_cards
+        self.discard_piles = game.discard_piles
+        self.play_piles = game.play_piles
         # mask other player hands
-        self.player_hands = copy_nested(game.player_hands)
-        self.player_hands = [
+        self.player_hands = tuple(
             hand if i == self.current_player else None \
-                for i, hand in zip(range(len(self.player_hands)), self.player_hands)
-            ]
+                for i, hand in enumerate(game.player_hands)
+            )
+        self.shared = True
+
+        # the goal piles, other hands and draw pile are hidden, but not how big they are
+        self.pile_sizes = game.get_pile_sizes()
 
         # store the last move
         self.last_move = None
 
-        self.make_immutable()
+    def unshare(self):
+        '''
+            Copy the piles shared with the game, as lists, so the view can be changed
+        '''
+        self.goal_cards = list(self.goal_cards)
+        self.discard_piles = copy_nested(self.discard_piles)
+        self.play_piles = copy_nested(self.play_piles)
+        self.player_hands = copy_nested(self.player_hands)
+        self.shared = False
+
+    def copy_mutable(self):
+        clone = super().copy_mutable()
+        clone.shared = False
+        return clone
 
     def make_immutable(self):
+        if self.shared:
+            self.unshare()
         for attr, value in self.__dict__.items():
             if attr.startswith('__'):
                 continue
             if isinstance(value, list):
                 self.__dict__[attr] = copy_nested(value, immutable=True)
+        self.shared = False
+
+    def get_pile_sizes(self):
+        '''
+            Pile sizes when the view was made - they aren't updated by moves
+        '''
+        return self.pile_sizes
+
+    def state_key(self):
+        '''
+            Return a hashable key which is the same for equivalent states, no matter what order the
+            moves that led to them were played in
+            Only what the player to move (or who just ended their turn) can change is included:
+            their goal card, hand as a sorted multiset, discard piles and the play pile lengths
+            Symmetries are folded together:
+                kings and jokers are both wild, and suits don't matter, so cards are canonical values
+                discard piles and play piles can be swapped around, so they're sorted
+        '''
+        player = self.current_player
+        ended_turn = self.last_move is not None and self.last_move.type == MOVE_END_TURN
+        if ended_turn:
+            player = (player - 1) % self.num_players
+
+        hand = self.player_hands[player]
+        if hand is not None:
+            hand = tuple(sorted([card.canonical for card in hand]))
+        discard_piles = tuple(sorted([tuple([card.canonical for card in pile]) for pile in self.discard_piles[player]]))
+        play_piles = tuple(sorted([len(pile) for pile in self.play_piles]))
+
+        return (player, ended_turn, canonical_value(self.goal_cards[player]), hand, discard_piles, play_piles)
 
     def get_legal_moves(self):
         '''
@@ -63,26 +119,67 @@ class HiddenGame(Game):
                 if self.is_valid_play(card, j):
                     from_discard.append(Move(MOVE_PLAY_DISCARD, (i, j)))
 
+        # the goal card is None once it's been played, until the turn ends
+        goal_card = self.goal_cards[self.current_player]
         for i in range(NUM_PLAY_PILES):
-            if self.is_valid_play(self.goal_cards[self.current_player], i):
+            if goal_card is not None and self.is_valid_play(goal_card, i):
                 from_goal.append(Move(MOVE_PLAY_GOAL, (i,)))
     
         return (from_goal, from_hand, from_discard, end_turn)
 
-    def fill_hand(self):
+    def get_coalesced_moves(self, allowed_moves):
+        '''
+            Return a list of legal moves of the types in allowed_moves, with only one move for each
+            group of moves that lead to the same state (see movegen.coalesced_moves)
+        '''
+        player = self.current_player
+        goal_card = self.goal_cards[player]
+        # kings and jokers are interchangeable, and so are cards of the same value in different suits
+        hand = {card.canonical: card for card in self.player_hands[player]}
+        discard_piles = self.discard_piles[player]
+        discard_keys = [tuple([card.canonical for card in pile]) for pile in discard_piles]
+        discard_tops = [pile[-1].value if len(pile) > 0 else 0 for pile in discard_piles]
+        play_lengths = [len(pile) for pile in self.play_piles]
+        return coalesced_moves(allowed_moves, goal_card.value if goal_card is not None else 0,
+                hand, discard_keys, discard_tops, play_lengths)
+
+    def apply(self, move):
+        if self.shared:
+            self.unshare()
+        return super().apply(move)
+
+    def fill_hand(self, undo_log):
         pass
 
-    def do_other_work(self):
+    def do_other_work(self, undo_log):
         '''
             Do everything that isn't shared with Game
         '''
         # remove full play piles
         for i in range(len(self.play_piles)):
             if len(self.play_piles[i]) == MAX_CARDS_PER_PLAY_PILE:
+                undo_log.append((UNDO_CLEAR_PLAY_PILE, i, self.play_piles[i]))
                 self.play_piles[i] = []
 
+    def follow(self, game, move):
+        '''
+            Apply a move which was just applied to game, so one view can be reused for a whole game
+            instead of making a new HiddenGame every move
+            The view's piles must be lists (see copy_mutable) - anything the view can't work out
+            by itself (drawn cards, the next goal card, the winner, pile sizes) is copied from game
+        '''
+        ended_turn = move.type == MOVE_END_TURN
+        self.apply(move)
+        if ended_turn:
+            self.player_hands[(self.current_player - 1) % self.num_players] = None
+        self.player_hands[self.current_player] = game.player_hands[self.current_player][:]
+        self.goal_cards[:] = game.goal_cards
+        self.winner = game.winner
+        self.pile_sizes = game.get_pile_sizes()
+        # a new HiddenGame doesn't know the last move either
+        self.last_move = None
+
     def do_move(self, move):
         game = super().do_move(move)
-        game.last_move = move
         game.make_immutable()
         return game
@@ -0,0 +1,331 @@
+#!/usr/bin/env python3
+'''
+    A league of agent configs playing each other for Elo ratings
+
+    Each round pairs the agents up (every pair for round robin, or agents with similar ratings for
+    Swiss), and each pairing plays games_per_pairing games from the same deal with the seats rotated,
+    so neither agent gets the luckier seat. Ratings are updated in the order the games were scheduled,
+    whatever order they finish in, so a league with the same seed always ends up the same. The league
+    is checkpointed to a JSON file, so a long run can be killed and resumed without playing finished
+    games again. A stalemate counts as a draw.
+'''
+import os, json, math, random, argparse, time
+from multiprocessing import Pool
+
+from game import Game
+from basicagent import BasicAgent
+from randomagent import RandomAgent
+from montecarloagent import MonteCarloAgent
+from selfplay import play_headless
+
+VERSION = 1
+AGENT_TYPES = {
+        'basic': BasicAgent,
+        'random': RandomAgent,
+        'montecarlo': MonteCarloAgent,
+        }
+# name -> (agent type, keyword arguments), used when no agents are given
+# node limits rather than time limits keep the games reproducible
+DEFAULT_AGENTS = {
+        'basic': ('basic', {'max_move_ms': None, 'max_nodes': 2000}),
+        'basic-beliefs': ('basic', {'max_move_ms': None, 'max_nodes': 2000, 'track_beliefs': True}),
+        'basic-500': ('basic', {'max_move_ms': None, 'max_nodes': 500}),
+        'random': ('random', {'max_move_ms': None, 'max_nodes': 2000}),
+        }
+INITIAL_RATING = 1500
+DEFAULT_K = 16
+DEFAULT_GOAL_SIZE = 10
+# z for a 95% confidence interval
+CONFIDENCE_Z = 1.96
+
+# agents made in this worker process, by name
+worker_agents = {}
+
+def parse_agent(spec):
+    '''
+        Parse 'name=type' or 'name=type:key=value,key=value' into (name, (type, kwargs))
+        Values are read as JSON if possible (so numbers, true/false and null work) and are strings otherwise
+    '''
+    name, _, config = spec.partition('=')
+    agent_type, _, args = config.partition(':')
+    if name == '' or agent_type not in AGENT_TYPES:
+        raise RuntimeError("Bad agent {} - expected name=type[:key=value,...] with type one of {}".format(
+            spec, ', '.join(AGENT_TYPES)))
+    kwargs = {'max_move_ms': None}
+    for arg in args.split(',') if args else []:
+        key, _, value = arg.partition('=')
+        try:
+            kwargs[key] = json.loads(value)
+        except ValueError:
+            kwargs[key] = value
+    return name, (agent_type, kwargs)
+
+def expected_score(rating, other_rating):
+    return 1 / (1 + 10 ** ((other_rating - rating) / 400))
+
+def elo_interval(wins, draws, losses):
+    '''
+        Return (Elo difference, low, high) implied by a score, with a 95% confidence interval
+        from the variance of the per-game scores
+        The bounds are None where the score (or the end of its interval) is all wins or all losses
+    '''
+    n = wins + draws + losses
+    if n == 0:
+        return (None, None, None)
+    score = (wins + draws / 2) / n
+    variance = (wins + draws / 4) / n - score ** 2
+    margin = CONFIDENCE_Z * math.sqrt(variance / n)
+    to_elo = lambda p: -400 * math.log10(1 / p - 1) if 0 < p < 1 else None
+    return (to_elo(score), to_elo(max(score - margin, 0)), to_elo(min(score + margin, 1)))
+
+def format_elo(elo):
+    return '?' if elo is None else '{:+d}'.format(round(elo))
+
+def round_robin_pairings(names):
+    return [(a, b) for i, a in enumerate(names) for b in names[i + 1:]]
+
+def swiss_pairings(names, ratings, pair_records):
+    '''
+        Pair each agent, best rated first, with the closest rated agent it has played least
+        With an odd number of agents the lowest rated one left over sits out
+    '''
+    left = sorted(names, key=lambda name: -ratings[name])
+    pairings = []
+    while len(left) > 1:
+        a = left.pop(0)
+        b = min(left, key=lambda b: (sum(pair_records[a][b]), abs(ratings[a] - ratings[b])))
+        left.remove(b)
+        pairings.append((a, b))
+    return pairings
+
+def play_league_game(args):
+    '''
+        Run in a worker process: play one game with the agents seated in order
+        Return (game id, seats, winning seat or None for a stalemate, number of turns)
+    '''
+    game_id, seed, seats, agents, goal_size = args
+    players = []
+    for name in seats:
+        if name not in worker_agents:
+            agent_type, kwargs = agents[name]
+            worker_agents[name] = AGENT_TYPES[agent_type](**kwargs)
+        players.append(worker_agents[name])
+    random.seed(seed)
+    winner, num_turns, _ = play_headless(Game(num_players=len(seats), goal_size=goal_size, seed=seed), players)
+    return (game_id, seats, winner, num_turns)
+
+class League:
+    '''
+        Ratings, results and the games left in the current round
+        Everything is plain JSON data, so the whole league is its checkpoint
+    '''
+    def __init__(self, agents, schedule='roundrobin', games_per_pairing=2, k=DEFAULT_K, seed=0,
+            goal_size=DEFAULT_GOAL_SIZE):
+        '''
+            agents maps names to (agent type, keyword arguments)
+            The games of the nth pairing ever scheduled are dealt from seed + n
+        '''
+        self.agents = agents
+        self.schedule = schedule
+        self.games_per_pairing = games_per_pairing
+        self.k = k
+        self.seed = seed
+        self.goal_size = goal_size
+        self.ratings = {name: INITIAL_RATING for name in agents}
+        # [wins, draws, losses] for each agent, and for each agent against each other agent
+        self.records = {name: [0, 0, 0] for name in agents}
+        self.pair_records = {a: {b: [0, 0, 0] for b in agents if b != a} for a in agents}
+        self.num_rounds = 0
+        self.num_pairings = 0
+        self.num_games = 0
+        self.num_turns = 0
+        # [game id, seed, seats] of the games in this round which haven't finished
+        self.pending = []
+        # [game id, seats, winner, number of turns] of finished games waiting for earlier games to finish
+        self.finished = []
+
+    def to_dict(self):
+        data = dict(self.__dict__)
+        data['version'] = VERSION
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        if data.get('version') != VERSION:
+            raise RuntimeError("Not a version {} league checkpoint".format(VERSION))
+        league = cls({})
+        for key, value in data.items():
+            if key != 'version':
+                setattr(league, key, value)
+        league.agents = {name: tuple(config) for name, config in league.agents.items()}
+        return league
+
+    def save(self, path):
+        '''
+            Write the checkpoint to a temporary file first, so a kill never leaves half a checkpoint
+        '''
+        temp_path = path + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump(self.to_dict(), f)
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            return cls.from_dict(json.load(f))
+
+    def start_round(self):
+        '''
+            Schedule the next round's games
+        '''
+        names = sorted(self.agents)
+        if self.schedule == 'swiss':
+            pairings = swiss_pairings(names, self.ratings, self.pair_records)
+        else:
+            pairings = round_robin_pairings(names)
+        for pairing in pairings:
+            seed = self.seed + self.num_pairings
+            self.num_pairings += 1
+            for i in range(self.games_per_pairing):
+                seats = list(pairing[i % 2:]) + list(pairing[:i % 2])
+                self.pending.append([self.num_games + len(self.pending), seed, seats])
+        self.num_rounds += 1
+
+    def game_args(self):
+        return [(game_id, seed, seats, self.agents, self.goal_size) for game_id, seed, seats in self.pending]
+
+    def add_result(self, game_id, seats, winner, num_turns):
+        '''
+            Record a finished game, then apply every finished game whose turn has come
+            Game ids go up by one in the order games were scheduled, and the next one to apply is num_games
+        '''
+        self.pending = [game for game in self.pending if game[0] != game_id]
+        self.finished.append([game_id, seats, winner, num_turns])
+        self.finished.sort()
+        while len(self.finished) > 0 and self.finished[0][0] == self.num_games:
+            self.apply_result(*self.finished.pop(0)[1:])
+
+    def apply_result(self, seats, winner, num_turns):
+        '''
+            Update the records and ratings with a finished game
+        '''
+        a, b = seats
+        # a's result: win, draw or loss is index 0, 1 or 2 of a record
+        result = 1 if winner is None else (0 if winner == 0 else 2)
+        score = (2 - result) / 2
+        self.records[a][result] += 1
+        self.records[b][2 - result] += 1
+        self.pair_records[a][b][result] += 1
+        self.pair_records[b][a][2 - result] += 1
+
+        expected = expected_score(self.ratings[a], self.ratings[b])
+        self.ratings[a] += self.k * (score - expected)
+        self.ratings[b] -= self.k * (score - expected)
+
+        self.num_games += 1
+        self.num_turns += num_turns
+
+    def widest_interval(self):
+        '''
+            Return the widest half-width of any agent's confidence interval, or None if any is unbounded
+        '''
+        widest = 0
+        for name in self.agents:
+            elo, low, high = elo_interval(*self.records[name])
+            if elo is None or low is None or high is None:
+                return None
+            widest = max(widest, elo - low, high - elo)
+        return widest
+
+    def print_table(self):
+        print('Round {}, {} games, avg turns per game: {:.1f}'.format(
+            self.num_rounds, self.num_games, self.num_turns / max(self.num_games, 1)))
+        print('  {:<20} {:>7} {:>16} {:>24}'.format('agent', 'rating', 'W-D-L', 'vs field (95% CI)'))
+        for name in sorted(self.agents, key=lambda name: -self.ratings[name]):
+            elo, low, high = elo_interval(*self.records[name])
+            print('  {:<20} {:>7.0f} {:>16} {:>24}'.format(name, self.ratings[name],
+                '-'.join(str(n) for n in self.records[name]),
+                '{} [{}, {}]'.format(format_elo(elo), format_elo(low), format_elo(high))))
+        print('  head to head (row vs column, Elo difference):')
+        names = sorted(self.agents)
+        print('  {:<20} '.format('') + ' '.join('{:>14}'.format(name[:14]) for name in names))
+        for a in names:
+            cells = []
+            for b in names:
+                cells.append('' if a == b else format_elo(elo_interval(*self.pair_records[a][b])[0]))
+            print('  {:<20} '.format(a) + ' '.join('{:>14}'.format(cell) for cell in cells))
+
+def main():
+    parser = argparse.ArgumentParser(description="Rate agent configs against each other in a resumable league")
+    parser.add_argument('checkpoint',
+            help='league checkpoint file - resumed from if it exists, keeping its agents and settings')
+    parser.add_argument('--agent', action='append', dest='agents', metavar='NAME=TYPE[:KEY=VALUE,...]',
+            help='an agent config to enter, e.g. basic-100=basic:max_nodes=100 (default: {})'.format(
+                ', '.join(DEFAULT_AGENTS)))
+    parser.add_argument('--schedule', choices=['roundrobin', 'swiss'], default='roundrobin',
+            help='how each round pairs agents up')
+    parser.add_argument('--games-per-pairing', type=int, default=2, dest='games_per_pairing',
+            help='games each pairing plays from the same deal, rotating seats')
+    parser.add_argument('-k', type=float, default=DEFAULT_K, help='Elo K factor')
+    parser.add_argument('-s', '--seed', type=int, default=None, help='seed for the first pairing\'s deal')
+    parser.add_argument('-r', '--rounds', type=int, default=10, help='stop after this many rounds in total')
+    parser.add_argument('--target-ci', type=float, default=None, dest='target_ci',
+            help='stop once every agent\'s 95%% confidence interval is within this many Elo')
+    parser.add_argument('-w', '--workers', type=int, default=1, help='number of processes to play games in')
+    parser.add_argument('--checkpoint-every', type=int, default=10, dest='checkpoint_every',
+            help='save the checkpoint after this many games')
+    args = parser.parse_args()
+
+    if os.path.exists(args.checkpoint):
+        league = League.load(args.checkpoint)
+        if args.agents is not None and sorted(dict(map(parse_agent, args.agents))) != sorted(league.agents):
+            parser.error('the agents given differ from the ones in {}'.format(args.checkpoint))
+        print('Resuming {} after {} games'.format(args.checkpoint, league.num_games + len(league.finished)))
+    else:
+        agents = DEFAULT_AGENTS if args.agents is None else dict(map(parse_agent, args.agents))
+        if len(agents) < 2:
+            parser.error('a league needs at least two agents')
+        seed = args.seed
+        if seed is None:
+            seed = random.SystemRandom().randrange(2**32)
+        league = League(agents, args.schedule, args.games_per_pairing, args.k, seed)
+        print('Starting {} (seed {})'.format(args.checkpoint, seed))
+
+    pool = Pool(args.workers) if args.workers > 1 else None
+    start_time = time.perf_counter()
+    unsaved = 0
+    try:
+        while True:
+            if len(league.pending) == 0:
+                if league.num_rounds > 0:
+                    league.print_table()
+                    widest = league.widest_interval()
+                    if args.target_ci is not None and widest is not None and widest <= args.target_ci:
+                        print('Every confidence interval is within {} Elo'.format(args.target_ci))
+                        break
+                if league.num_rounds >= args.rounds:
+                    break
+                league.start_round()
+                league.save(args.checkpoint)
+
+            if pool is not None:
+                results = pool.imap_unordered(play_league_game, league.game_args())
+            else:
+                results = map(play_league_game, league.game_args())
+            for result in results:
+                league.add_result(*result)
+                unsaved += 1
+                if unsaved >= args.checkpoint_every:
+                    league.save(args.checkpoint)
+                    unsaved = 0
+                print('.', end='', flush=True)
+            print('')
+    finally:
+        league.save(args.checkpoint)
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+    print('Played for {:.1f}s'.format(time.perf_counter() - start_time))
+
+if __name__=='__main__':
+    main()
@@ -12,7 +12,10 @@ def main():
     human_agent = HumanAgent()
     basic_agent = BasicAgent()
     random_agent = RandomAgent()
-    game = Game(goal_size=8)
+    # print the seed, so the deal can be played again
+    seed = random.randrange(2**32)
+    print("Game seed: {}".format(seed))
+    game = Game(goal_size=8, seed=seed)
     #game = rig_game(game, 0)
     game = GameRunner(game, [basic_agent, random_agent])
     game.play()
@@ -0,0 +1,286 @@
+'''
+    An agent which chooses between candidate paths by playing out games with the hidden cards guessed
+'''
+import random, time
+from multiprocessing import Pool
+
+from basicagent import *
+from game import game_from_dict
+from movegen import VALID_PLAY
+
+# number of end of turn paths to play out
+DEFAULT_NUM_CANDIDATES = 4
+# time spent on rollouts for each move
+DEFAULT_ROLLOUT_MS = 200
+# number of turns to play out before judging the game by goal cards left (None plays to the end)
+DEFAULT_ROLLOUT_TURNS = 4
+# rollouts which go on longer than this are counted as draws
+MAX_ROLLOUT_MOVES = 2000
+
+class Determinizer:
+    '''
+        Everything one player can see of a game, stored as card codes so it's cheap to send to other processes
+        sample() deals out the cards they can't see at random, making a Game consistent with what they can see
+        If a BeliefTracker is given, the unseen cards come from it instead of scanning the view
+    '''
+    def __init__(self, hg, beliefs=None):
+        self.player = hg.current_player
+        goal_pile_sizes, hand_sizes, draw_pile_size = hg.get_pile_sizes()
+        self.goal_pile_sizes = goal_pile_sizes
+        self.hand_sizes = hand_sizes
+        encode = lambda cards: [card_code(card) for card in cards]
+        self.visible = {
+                'num_players': hg.num_players,
+                'num_decks': hg.num_decks,
+                'goal_size': hg.goal_size,
+                'hand_size': hg.hand_size,
+                'current_player': hg.current_player,
+                'winner': hg.winner,
+                'goal_cards': [None if card is None else card_code(card) for card in hg.goal_cards],
+                'hand': encode(hg.player_hands[self.player]),
+                'discard_piles': [[encode(pile) for pile in piles] for piles in hg.discard_piles],
+                'play_piles': [encode(pile) for pile in hg.play_piles],
+                }
+
+        if beliefs is not None:
+            self.unseen = beliefs.unseen_codes()
+        else:
+            self.unseen = self.find_unseen(hg.num_decks)
+
+        if len(self.unseen) != sum(goal_pile_sizes) + sum(hand_sizes) - hand_sizes[self.player] + draw_pile_size:
+            raise RuntimeError("Pile sizes don't match the unseen cards")
+
+    def find_unseen(self, num_decks):
+        '''
+            Return codes of the cards which aren't visible
+        '''
+        # everything that isn't visible is in a goal pile, another hand or the draw pile
+        counts = [0 for _ in range(len(DECK))]
+        for card in make_decks(num_decks):
+            counts[card_code(card)] += 1
+        visible_codes = self.visible['hand'] + [code for code in self.visible['goal_cards'] if code is not None]
+        for piles in self.visible['discard_piles']:
+            for pile in piles:
+                visible_codes += pile
+        for pile in self.visible['play_piles']:
+            visible_codes += pile
+        for code in visible_codes:
+            if counts[code] == 0:
+                # views which only know card values (e.g. CompactGame hands) may have the wrong suit
+                code = next(other for other in range(len(DECK))
+                        if counts[other] > 0 and DECK[other].value == DECK[code].value)
+            counts[code] -= 1
+        return [code for code in range(len(DECK)) for _ in range(counts[code])]
+
+    def sample(self, rng):
+        '''
+            Return a Game with the unseen cards dealt at random using rng
+        '''
+        unseen = self.unseen[:]
+        rng.shuffle(unseen)
+
+        def deal(size):
+            cards = unseen[len(unseen) - size:]
+            del unseen[len(unseen) - size:]
+            return cards
+
+        data = dict(self.visible)
+        data['player_hands'] = [
+                data['hand'] if i == self.player else deal(size) for i, size in enumerate(self.hand_sizes)
+            ]
+        data['goal_piles'] = [deal(size) for size in self.goal_pile_sizes]
+        data['draw_pile'] = unseen
+        return game_from_dict(data)
+
+def rollout_move(game):
+    '''
+        A cheap greedy policy for playing out games:
+        play the goal card, then non-wild cards from discard piles and the hand, then a wild if it
+        makes the goal card playable, and otherwise end the turn by discarding the highest non-wild card
+    '''
+    player = game.current_player
+    lengths = [len(pile) for pile in game.play_piles]
+    goal = game.goal_cards[player]
+    hand = game.player_hands[player]
+    discard_piles = game.discard_piles[player]
+
+    for i, length in enumerate(lengths):
+        if VALID_PLAY[goal.value][length]:
+            return Move(MOVE_PLAY_GOAL, (i,))
+
+    for j, pile in enumerate(discard_piles):
+        if len(pile) > 0 and not pile[-1].is_wild():
+            for i, length in enumerate(lengths):
+                if VALID_PLAY[pile[-1].value][length]:
+                    return Move(MOVE_PLAY_DISCARD, (j, i))
+
+    wild = None
+    for card in hand:
+        if card.is_wild():
+            wild = card
+            continue
+        for i, length in enumerate(lengths):
+            if VALID_PLAY[card.value][length]:
+                return Move(MOVE_PLAY_HAND, (card, i))
+
+    if wild is not None:
+        for i, length in enumerate(lengths):
+            if length + 2 == goal.value:
+                return Move(MOVE_PLAY_HAND, (wild, i))
+
+    # discard the highest card, on a pile it continues down from if possible, otherwise an empty one
+    card = max(hand, key=lambda card: -1 if card.is_wild() else card.value)
+    best_pile = 0
+    for j, pile in enumerate(discard_piles):
+        if len(pile) > 0 and pile[-1].value == card.value + 1:
+            best_pile = j
+            break
+        if len(pile) == 0 and len(discard_piles[best_pile]) > 0:
+            best_pile = j
+    return Move(MOVE_END_TURN, (card, best_pile))
+
+def rollout(game, player, max_turns=None):
+    '''
+        Play game out with rollout_move for up to max_turns turns (or to the end if None), changing it in place
+        Return 1 if player wins, 0 if someone else does and 0.5 for a stalemate
+        If the game isn't over, return how far ahead player is on goal cards, between 0 and 1
+    '''
+    turns_left = max_turns
+    for _ in range(MAX_ROLLOUT_MOVES):
+        if game.winner is not None:
+            return 1 if game.winner == player else 0
+        if game.is_stalemate():
+            return 0.5
+        move = rollout_move(game)
+        game.apply(move)
+        if move.type == MOVE_END_TURN and turns_left is not None:
+            turns_left -= 1
+            if turns_left == 0:
+                break
+    goals_left = [len(pile) + 1 for pile in game.goal_piles]
+    closest_other = min(left for i, left in enumerate(goals_left) if i != player)
+    return 0.5 + (closest_other - goals_left[player]) / (2 * game.goal_size)
+
+def run_rollouts(args):
+    '''
+        Play out each path on games sampled from a Determinizer, until budget_ms runs out or max_samples
+        games have been sampled (at least one is always done)
+        Every path is played out on the same sample with the same draws, so the paths are compared fairly
+        Return (total score of each path, number of samples)
+    '''
+    determinizer, paths, max_turns, budget_ms, max_samples, seed = args
+    deadline = None if budget_ms is None else time.perf_counter() + budget_ms / 1000
+    rng = random.Random(seed)
+    scores = [0 for _ in paths]
+    num_samples = 0
+
+    while num_samples == 0 or ((max_samples is None or num_samples < max_samples) and \
+            (deadline is None or time.perf_counter() < deadline)):
+        game = determinizer.sample(rng)
+        draw_seed = rng.randrange(2**32)
+        for i, path in enumerate(paths):
+            sample = game.copy_mutable()
+            sample.rng = random.Random(draw_seed)
+            for move in path:
+                if sample.winner is not None:
+                    break
+                sample.apply(move)
+            scores[i] += rollout(sample, determinizer.player, max_turns)
+        num_samples += 1
+
+    return (scores, num_samples)
+
+class MonteCarloAgent(BasicAgent):
+    '''
+        An agent which plays out candidate paths on games with the hidden cards dealt at random
+        (determinizations), and picks the path with the best average result
+        Rollouts are split between worker processes, so more cores means more rollouts per move
+    '''
+    def __init__(self, num_candidates=DEFAULT_NUM_CANDIDATES, rollout_ms=DEFAULT_ROLLOUT_MS, max_samples=None,
+            rollout_turns=DEFAULT_ROLLOUT_TURNS, workers=1, seed=0, **kwargs):
+        '''
+            Up to num_candidates paths are found by BasicAgent's searches (within max_move_ms/max_nodes),
+            then played out for rollout_ms, or until each worker has done max_samples samples
+            Pass rollout_ms=None with max_samples for reproducible moves
+            Worker processes can't be started from daemon processes, e.g. a multiprocessing Pool's workers
+        '''
+        super().__init__(**kwargs)
+        if rollout_ms is None and max_samples is None:
+            raise RuntimeError("Rollouts need a time or sample limit")
+        self.name = 'MonteCarloAgent'
+        self.num_candidates = num_candidates
+        self.rollout_ms = rollout_ms
+        self.max_samples = max_samples
+        self.rollout_turns = rollout_turns
+        self.workers = workers
+        self.rng = random.Random(seed)
+        self.pool = None
+        # number of samples played out over all moves
+        self.num_samples = 0
+
+    def close(self):
+        '''
+            Stop the worker processes
+        '''
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+            self.pool = None
+
+    def get_search_stats(self):
+        stats = super().get_search_stats()
+        stats['rollout_samples'] = self.num_samples
+        return stats
+
+    def get_candidate_paths(self, hg):
+        '''
+            Return the paths worth playing out, in reverse order like all paths
+        '''
+        paths = []
+        path = self.find_path_to_empty_hand(hg)
+        if path is not None:
+            paths.append(path)
+        if not self.out_of_budget():
+            paths += self.find_best_paths(hg, self.num_candidates)
+        if len(paths) == 0:
+            # the budget ran out before there were any candidates
+            paths.append(self.do_good_moves(hg))
+        return paths
+
+    def evaluate_paths(self, hg, paths):
+        '''
+            Return the average rollout score of each path
+        '''
+        determinizer = Determinizer(hg, self.beliefs)
+        forward_paths = [path[::-1] for path in paths]
+        tasks = [(determinizer, forward_paths, self.rollout_turns, self.rollout_ms, self.max_samples, self.rng.randrange(2**32))
+                for _ in range(self.workers)]
+        if self.workers > 1:
+            if self.pool is None:
+                self.pool = Pool(self.workers)
+            results = self.pool.map(run_rollouts, tasks)
+        else:
+            results = [run_rollouts(tasks[0])]
+
+        scores = [0 for _ in paths]
+        num_samples = 0
+        for task_scores, task_samples in results:
+            scores = [a + b for a, b in zip(scores, task_scores)]
+            num_samples += task_samples
+        self.num_samples += num_samples
+        self.stats.add('rollout_samples', num_samples)
+        return [score / num_samples for score in scores]
+
+    def choose_path(self, hidden_game):
+        # always play the goal card if possible
+        path = self.find_path_to_goal(hidden_game)
+        if path is not None:
+            return path
+
+        paths = self.get_candidate_paths(hidden_game)
+        if len(paths) == 1:
+            return paths[0]
+        scores = self.evaluate_paths(hidden_game, paths)
+        # ties go to the earlier path, which the searches liked better
+        best = max(range(len(paths)), key=lambda i: (scores[i], -i))
+        return paths[best]
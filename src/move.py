@@ -11,11 +11,40 @@ MOVE_TYPES={
         }
 
 class Move:
-    def __init__(self, mtype, args):
-        if mtype not in MOVE_TYPES:
-            raise RuntimeError("Move type {} not in valid moves".format(mtype))
-        self.type = mtype
-        self.args = args
+    '''
+        A move, with args as a tuple of Cards and pile indices (see Game.apply)
+        Moves are immutable and interned: there are only a few hundred different moves, so Move(mtype, args)
+        returns the existing Move with that type and args instead of making a new one
+    '''
+    __slots__ = ('type', 'args')
+
+    def __new__(cls, mtype, args):
+        move = INTERNED_MOVES.get((mtype, args))
+        if move is None:
+            if mtype not in MOVE_TYPES:
+                raise RuntimeError("Move type {} not in valid moves".format(mtype))
+            move = object.__new__(cls)
+            object.__setattr__(move, 'type', mtype)
+            object.__setattr__(move, 'args', args)
+            INTERNED_MOVES[(mtype, args)] = move
+        return move
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Moves can't be changed")
+
+    def __reduce__(self):
+        # unpickled moves are the interned ones too
+        return (Move, (self.type, self.args))
+
+    def __eq__(self, other):
+        if self is other:
+            return True
+        if not isinstance(other, Move):
+            return NotImplemented
+        return self.type == other.type and self.args == other.args
+
+    def __hash__(self):
+        return hash((self.type, self.args))
 
     def repr(self, hg):
         '''
@@ -53,4 +82,7 @@ class Move:
         else:
             on_card = "an empty space"
 
-        return "Play {} {} onto {}".format(card, from_str, on_card)
\ No newline at end of file
+        return "Play {} {} onto {}".format(card, from_str, on_card)
+
+# (type, args) -> Move
+INTERNED_MOVES = {}
\ No newline at end of file
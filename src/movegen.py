@@ -0,0 +1,133 @@
+'''
+    Fast generation of legal moves, coalesced into moves which lead to different states
+'''
+from game import NUM_DISCARD_PILES, NUM_PLAY_PILES, MAX_CARDS_PER_PLAY_PILE
+from move import *
+from cards import canonical_value
+
+# VALID_PLAY[value][length] is True if a card with that value can be played on a pile with that many cards
+# value 0 (no card) can never be played
+VALID_PLAY = tuple(
+        tuple(value >= 13 or (value > 0 and length + 1 == value) for length in range(MAX_CARDS_PER_PLAY_PILE))
+        for value in range(15)
+    )
+
+def pile_for_lengths(play_lengths):
+    '''
+        Return a list of (length, play pile index) with one play pile for each distinct length
+        Piles with the same length are interchangeable, so only one of them needs to be tried
+    '''
+    piles = []
+    found = set()
+    for i, length in enumerate(play_lengths):
+        if length not in found:
+            found.add(length)
+            piles.append((length, i))
+    return piles
+
+def coalesced_moves(allowed_moves, goal_value, hand, discard_keys, discard_tops, play_lengths):
+    '''
+        Generate the moves of the types in allowed_moves, with one move for each class of equivalent moves:
+            play goal: per play pile length
+            play from hand: per (card value, play pile length)
+            play from discard: per (discard pile, play pile length)
+            end turn: per (card value, discard pile)
+        hand maps each canonical value in the hand (kings and jokers are both 13) to a Card with that value
+        discard_keys are hashable canonical contents of the current player's discard piles, and discard_tops
+        the values of their top cards (0 if empty)
+        Moves are only created for valid plays, one per class
+        Return a list of Moves, in the order of allowed_moves
+    '''
+    moves = []
+    piles = pile_for_lengths(play_lengths)
+
+    for move_type in allowed_moves:
+
+        if move_type == MOVE_PLAY_GOAL:
+            valid = VALID_PLAY[goal_value]
+            for length, i in piles:
+                if valid[length]:
+                    moves.append(Move(MOVE_PLAY_GOAL, (i,)))
+
+        elif move_type == MOVE_PLAY_HAND:
+            for value, card in hand.items():
+                valid = VALID_PLAY[value]
+                for length, i in piles:
+                    if valid[length]:
+                        moves.append(Move(MOVE_PLAY_HAND, (card, i)))
+
+        elif move_type == MOVE_PLAY_DISCARD:
+            found = set()
+            for j in range(NUM_DISCARD_PILES):
+                if discard_tops[j] == 0 or discard_keys[j] in found:
+                    continue
+                found.add(discard_keys[j])
+                valid = VALID_PLAY[discard_tops[j]]
+                for length, i in piles:
+                    if valid[length]:
+                        moves.append(Move(MOVE_PLAY_DISCARD, (j, i)))
+
+        elif move_type == MOVE_END_TURN:
+            discard_piles = []
+            found = set()
+            for j in range(NUM_DISCARD_PILES):
+                if discard_keys[j] not in found:
+                    found.add(discard_keys[j])
+                    discard_piles.append(j)
+            for card in hand.values():
+                for j in discard_piles:
+                    moves.append(Move(MOVE_END_TURN, (card, j)))
+
+        else:
+            raise RuntimeError("Invalid move type!")
+
+    return moves
+
+def coalesce_legal_moves(hg, allowed_moves):
+    '''
+        The original way of coalescing moves, by generating every legal move and putting them in buckets
+        Much slower than coalesced_moves, but kept to check it against
+    '''
+    moves = []
+    legal_moves = hg.get_legal_moves()
+    for move_type in allowed_moves:
+        # each bucket contains moves that are different but actually equivalent
+        # bucket key is a tuple of:
+        #   (MOVE_PLAY_GOAL, card_value, len(play_pile))
+        #   (MOVE_PLAY_HAND, card_value, len(play_pile))
+        #   (MOVE_PLAY_DISCARD, discard_pile, len(play_pile))
+        #   (MOVE_END_TURN, card_value, discard_pile)
+        buckets = {}
+        for move in legal_moves[move_type]:
+
+            bucket_key = None
+
+            if move_type == MOVE_PLAY_GOAL:
+                card = hg.goal_cards[hg.current_player]
+                play_pile = hg.play_piles[move.args[0]]
+                bucket_key = (MOVE_PLAY_GOAL, card.value, len(play_pile))
+
+            elif move_type == MOVE_PLAY_HAND:
+                play_pile = hg.play_piles[move.args[1]]
+                bucket_key = (MOVE_PLAY_HAND, canonical_value(move.args[0]), len(play_pile))
+
+            elif move_type == MOVE_PLAY_DISCARD:
+                discard_pile = hg.discard_piles[hg.current_player][move.args[0]]
+                play_pile = hg.play_piles[move.args[1]]
+                bucket_key = (MOVE_PLAY_DISCARD, tuple(map(canonical_value, discard_pile)), len(play_pile))
+
+            elif move_type == MOVE_END_TURN:
+                discard_piles = hg.discard_piles[hg.current_player]
+                card = move.args[0]
+                pile = discard_piles[move.args[1]]
+                # kings and jokers are both wild, so they're folded together
+                bucket_key = (MOVE_END_TURN, canonical_value(card), tuple(map(canonical_value, pile)))
+
+            else:
+                raise RuntimeError("Invalid move type!")
+
+            buckets[bucket_key] = move
+
+        moves += buckets.values()
+
+    return moves
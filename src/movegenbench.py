@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+'''
+    Microbenchmark comparing the coalesced move generator against the original get_legal_moves + buckets
+'''
+import random, argparse, time
+
+from game import Game
+from hiddengame import HiddenGame
+from compactgame import CompactGame
+from move import *
+from movegen import coalesce_legal_moves
+
+ALL_MOVES = [MOVE_PLAY_HAND, MOVE_PLAY_DISCARD, MOVE_PLAY_GOAL, MOVE_END_TURN]
+
+def random_positions(num_positions, seed):
+    '''
+        Make mid-game positions by playing random moves from new games
+        Return a list of HiddenGames
+    '''
+    rng_state = random.getstate()
+    random.seed(seed)
+    positions = []
+    while len(positions) < num_positions:
+        game = Game(goal_size=10)
+        for _ in range(random.randrange(20, 120)):
+            if game.winner is not None or game.is_stalemate():
+                break
+            hg = HiddenGame(game)
+            legal_moves = hg.get_legal_moves()
+            # mostly play cards, so the play and discard piles fill up
+            moves = legal_moves[MOVE_PLAY_HAND] + legal_moves[MOVE_PLAY_DISCARD]
+            if len(moves) == 0 or random.random() < 0.3:
+                moves = legal_moves[MOVE_END_TURN]
+            game = game.do_move(random.choice(moves))
+        if game.winner is None and not game.is_stalemate():
+            positions.append(HiddenGame(game))
+    random.setstate(rng_state)
+    return positions
+
+def move_classes(hg, moves):
+    '''
+        Describe moves by the state they lead to, to check both generators find the same moves
+        The generators may pick different piles out of identical ones, so the piles are sorted
+    '''
+    keys = [hg.do_move(move).state_key() for move in moves]
+    return sorted(key[:-2] + (tuple(sorted(key[-2])), tuple(sorted(key[-1]))) for key in keys)
+
+def time_generator(generate, positions, repeats):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        for position in positions:
+            generate(position)
+    return (time.perf_counter() - start) / (repeats * len(positions))
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark legal move generation")
+    parser.add_argument('-n', '--num-positions', type=int, default=200, dest='num_positions')
+    parser.add_argument('-r', '--repeats', type=int, default=50)
+    parser.add_argument('-s', '--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    positions = random_positions(args.num_positions, args.seed)
+    compact_positions = [CompactGame(position) for position in positions]
+
+    # check the generators agree before timing them
+    for position in positions:
+        if move_classes(position, coalesce_legal_moves(position, ALL_MOVES)) != \
+                move_classes(position, position.get_coalesced_moves(ALL_MOVES)):
+            raise RuntimeError("Generators disagree!")
+
+    results = [
+            ('buckets (HiddenGame)', time_generator(lambda hg: coalesce_legal_moves(hg, ALL_MOVES), positions, args.repeats)),
+            ('coalesced (HiddenGame)', time_generator(lambda hg: hg.get_coalesced_moves(ALL_MOVES), positions, args.repeats)),
+            ('coalesced (CompactGame)', time_generator(lambda hg: hg.get_coalesced_moves(ALL_MOVES), compact_positions, args.repeats)),
+        ]
+    baseline = results[0][1]
+    for name, seconds in results:
+        print('{:>25}: {:8.2f} us/position  ({:.1f}x)'.format(name, seconds * 1e6, baseline / seconds))
+
+if __name__=='__main__':
+    main()
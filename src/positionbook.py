@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+'''
+    A persistent cache of the path an agent chose from a position, so positions which come up again
+    (mostly at the start of games) don't have to be searched again
+
+    The book file is memory mapped and only the records which are looked up are read:
+        header: magic, version, clock, number of records
+        index: (key hash, record offset, last used clock) for each record, sorted by hash
+        records: key length, key, path length, path
+    The clock goes up by one every save, and when there are too many records the ones used least
+    recently are dropped
+'''
+import os, mmap, struct, hashlib, argparse, random, time
+from collections import OrderedDict
+
+from cards import canonical_value
+from move import *
+
+MAGIC = b'SMPB'
+VERSION = 1
+HEADER = struct.Struct('<4sBII')
+INDEX_ENTRY = struct.Struct('<QII')
+MOVE_ENTRY = struct.Struct('<BBB')
+DEFAULT_MAX_ENTRIES = 200000
+# path lengths are stored in a byte
+MAX_PATH_LENGTH = 255
+
+def position_key(agent_name, hg, goal_pile_sizes=False):
+    '''
+        Return bytes describing everything BasicAgent's searches look at in hg, so positions with the
+        same key get the same path
+        Players are listed starting from the current player, so the key doesn't depend on whose seat it is
+        Kings and jokers are both wild, so they're folded together
+        Goal pile sizes are only in the key if goal_pile_sizes is True, for agents which score states with them
+    '''
+    player = hg.current_player
+    players = [(player + i) % hg.num_players for i in range(hg.num_players)]
+    hand = sorted(canonical_value(card) for card in hg.player_hands[player])
+    key = [hg.num_players, hg.num_decks, hg.hand_size]
+    key += [canonical_value(hg.goal_cards[i]) for i in players]
+    key += [len(hand)] + hand
+    for i in players:
+        for pile in hg.discard_piles[i]:
+            key += [len(pile)] + [canonical_value(card) for card in pile]
+    key += [len(pile) for pile in hg.play_piles]
+    if goal_pile_sizes:
+        sizes = hg.get_pile_sizes()[0]
+        key += [sizes[i] for i in players]
+    return agent_name.encode() + b'\0' + bytes(key)
+
+def encode_path(path):
+    '''
+        Encode a path as (type, arg, arg) for each move, with cards as their canonical value
+    '''
+    data = []
+    for move in path:
+        if move.type == MOVE_PLAY_GOAL:
+            data.append(MOVE_ENTRY.pack(move.type, move.args[0], 0))
+        elif move.type == MOVE_PLAY_DISCARD:
+            data.append(MOVE_ENTRY.pack(move.type, move.args[0], move.args[1]))
+        else:
+            data.append(MOVE_ENTRY.pack(move.type, canonical_value(move.args[0]), move.args[1]))
+    return b''.join(data)
+
+def decode_path(data, hg):
+    '''
+        Turn an encoded path back into Moves, using the cards in the current player's hand
+        The path is in reverse order (like agents' paths), so the hand is used up from the end
+    '''
+    hand = {}
+    for card in hg.player_hands[hg.current_player]:
+        hand.setdefault(canonical_value(card), []).append(card)
+    path = []
+    for move_type, a, b in reversed(list(MOVE_ENTRY.iter_unpack(data))):
+        if move_type == MOVE_PLAY_GOAL:
+            path.append(Move(move_type, (a,)))
+        elif move_type == MOVE_PLAY_DISCARD:
+            path.append(Move(move_type, (a, b)))
+        else:
+            path.append(Move(move_type, (hand[a].pop(), b)))
+    path.reverse()
+    return path
+
+def key_hash(key):
+    return struct.unpack('<Q', hashlib.blake2b(key, digest_size=8).digest())[0]
+
+class PositionBook:
+    '''
+        Maps position keys to encoded paths
+        Entries found or added since loading are kept in memory (up to max_entries, least recently
+        used first out) until save() merges them into the file
+    '''
+    def __init__(self, path, max_entries=DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        # key -> encoded path, most recently used last
+        self.entries = OrderedDict()
+        # keys added since loading, rather than read from the file
+        self.new_keys = set()
+        # opened on the first lookup
+        self.file = None
+        self.data = None
+        self.clock = 0
+        self.num_records = 0
+        self.hits = 0
+        self.misses = 0
+
+    def open(self):
+        if self.data is not None:
+            return
+        self.data = b''
+        if os.path.exists(self.path) and os.path.getsize(self.path) > 0:
+            self.file = open(self.path, 'rb')
+            self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, version, self.clock, self.num_records = HEADER.unpack_from(self.data, 0)
+            if magic != MAGIC or version != VERSION:
+                raise RuntimeError("{} isn't a version {} position book".format(self.path, VERSION))
+
+    def close(self):
+        if self.file is not None:
+            self.data.close()
+            self.file.close()
+        self.file = None
+        self.data = None
+
+    def __len__(self):
+        self.open()
+        return self.num_records + len(self.new_keys)
+
+    def index_entry(self, i):
+        return INDEX_ENTRY.unpack_from(self.data, HEADER.size + i * INDEX_ENTRY.size)
+
+    def read_record(self, offset):
+        '''
+            Return the (key, encoded path) stored at offset
+        '''
+        key_length, = struct.unpack_from('<H', self.data, offset)
+        offset += 2
+        key = bytes(self.data[offset:offset + key_length])
+        offset += key_length
+        path_length = self.data[offset]
+        offset += 1
+        return key, bytes(self.data[offset:offset + path_length * MOVE_ENTRY.size])
+
+    def find_on_disk(self, key):
+        '''
+            Binary search the index for key, and return its encoded path or None
+        '''
+        target = key_hash(key)
+        lo, hi = 0, self.num_records
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.index_entry(mid)[0] < target:
+                lo = mid + 1
+            else:
+                hi = mid
+        # a few keys may share a hash
+        while lo < self.num_records:
+            entry_hash, offset, _ = self.index_entry(lo)
+            if entry_hash != target:
+                break
+            record_key, path = self.read_record(offset)
+            if record_key == key:
+                return path
+            lo += 1
+        return None
+
+    def remember(self, key, path):
+        self.entries[key] = path
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            old_key, _ = self.entries.popitem(last=False)
+            self.new_keys.discard(old_key)
+
+    def lookup(self, agent_name, hg, goal_pile_sizes=False):
+        '''
+            Return the path stored for hg (as Moves, in reverse order) or None
+            goal_pile_sizes is passed to position_key, and has to match what the path was stored with
+        '''
+        self.open()
+        key = position_key(agent_name, hg, goal_pile_sizes)
+        path = self.entries.get(key)
+        if path is None:
+            path = self.find_on_disk(key)
+        if path is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.remember(key, path)
+        return decode_path(path, hg)
+
+    def store(self, agent_name, hg, path, goal_pile_sizes=False):
+        if len(path) > MAX_PATH_LENGTH:
+            return
+        self.open()
+        key = position_key(agent_name, hg, goal_pile_sizes)
+        self.new_keys.add(key)
+        self.remember(key, encode_path(path))
+
+    def take_new_entries(self):
+        '''
+            Return {key: encoded path} for entries added since loading or the last call, e.g. to send
+            to the process which saves the book
+        '''
+        entries = {key: self.entries[key] for key in self.new_keys}
+        self.new_keys.clear()
+        return entries
+
+    def add_entries(self, entries):
+        self.open()
+        for key, path in entries.items():
+            self.new_keys.add(key)
+            self.remember(key, path)
+
+    def save(self):
+        '''
+            Merge the entries in memory into the file, keeping the max_entries most recently used
+        '''
+        self.open()
+        clock = self.clock + 1
+        # key -> (last used, encoded path)
+        records = {}
+        for i in range(self.num_records):
+            _, offset, last_used = self.index_entry(i)
+            key, path = self.read_record(offset)
+            records[key] = (last_used, path)
+        for key, path in self.entries.items():
+            records[key] = (clock, path)
+        kept = sorted(records.items(), key=lambda item: item[1][0], reverse=True)[:self.max_entries]
+        kept.sort(key=lambda item: key_hash(item[0]))
+
+        index = []
+        body = []
+        offset = HEADER.size + len(kept) * INDEX_ENTRY.size
+        for key, (last_used, path) in kept:
+            record = struct.pack('<H', len(key)) + key + bytes([len(path) // MOVE_ENTRY.size]) + path
+            index.append(INDEX_ENTRY.pack(key_hash(key), offset, last_used))
+            body.append(record)
+            offset += len(record)
+
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, VERSION, clock, len(kept)))
+            f.write(b''.join(index))
+            f.write(b''.join(body))
+        self.close()
+        os.replace(temp_path, self.path)
+        # start again from the new file
+        self.entries.clear()
+        self.new_keys.clear()
+
+def main():
+    from game import Game
+    from basicagent import BasicAgent
+    from selfplay import play_headless
+
+    parser = argparse.ArgumentParser(description="Warm up a position book by playing BasicAgent against itself")
+    parser.add_argument('book', help='position book file')
+    parser.add_argument('-n', '--num-games', type=int, default=100, dest='num_games', help='number of games')
+    parser.add_argument('-s', '--seed', type=int, default=0, help='game i is dealt from seed + i')
+    parser.add_argument('--max-nodes', type=int, default=None, dest='max_nodes',
+            help='limit on states expanded for each move')
+    parser.add_argument('--max-entries', type=int, default=DEFAULT_MAX_ENTRIES, dest='max_entries',
+            help='most positions to keep in the book')
+    args = parser.parse_args()
+
+    book = PositionBook(args.book, args.max_entries)
+    agents = [BasicAgent(max_move_ms=None, max_nodes=args.max_nodes, book=book) for _ in range(2)]
+    start_time = time.perf_counter()
+    for i in range(args.num_games):
+        random.seed(args.seed + i)
+        play_headless(Game(goal_size=10, seed=args.seed + i), agents)
+    book.save()
+    print('Played {} games in {:.2f}s'.format(args.num_games, time.perf_counter() - start_time))
+    print('  book hits: {}, misses: {}'.format(book.hits, book.misses))
+    print('  positions in book: {}'.format(len(book)))
+    book.close()
+
+if __name__=='__main__':
+    main()
@@ -6,8 +6,8 @@ class RandomAgent(BasicAgent):
         A simple autonomous agent
     '''
 
-    def __init__(self):
-        super().__init__()
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
         self.name = 'RandomAgent'
 
     def random_move(self, hg):
@@ -21,21 +21,16 @@ class RandomAgent(BasicAgent):
                 all_moves.append(move)
         return all_moves[random.randrange(len(all_moves))]
 
-    def get_move(self, hidden_game):
-
-        if len(self.path) > 0:
-            return self.path.pop()
+    def choose_path(self, hidden_game):
 
         # try to play a goal card at all costs
-        self.path = self.find_path_to_goal(hidden_game)
-        if self.path is not None:
-            return self.path.pop()
+        path = self.find_path_to_goal(hidden_game)
+        if path is not None:
+            return path
 
         # if no guaranteed goal path, try to empty hand
-        self.path = self.find_path_to_empty_hand(hidden_game)
-        if self.path is not None:
-            return self.path.pop()
-
-        self.path = [self.random_move(hidden_game)]
-        return self.path.pop()
+        path = self.find_path_to_empty_hand(hidden_game)
+        if path is not None:
+            return path
 
+        return [self.random_move(hidden_game)]
@@ -0,0 +1,128 @@
+'''
+    Memoized check of whether a player could play their goal card
+'''
+import functools
+from cards import canonical_value
+from game import MAX_CARDS_PER_PLAY_PILE
+
+# number of states remembered - this is enough for a whole game
+DEFAULT_CACHE_SIZE = 100000
+
+def required_values(goal, length):
+    '''
+        Return a bitmask of the values which must be played on a pile with length cards before a goal
+        card with value goal (not wild) can go on it - if the pile is already past the goal, it has
+        to be filled up and cleared first
+    '''
+    if length < goal:
+        values = range(length + 1, goal)
+    else:
+        values = list(range(length + 1, MAX_CARDS_PER_PLAY_PILE + 1)) + list(range(1, goal))
+    mask = 0
+    for value in values:
+        mask |= 1 << value
+    return mask
+
+# REQUIRED_VALUES[goal][length] is required_values(goal, length)
+REQUIRED_VALUES = [None] + [[required_values(goal, length) for length in range(MAX_CARDS_PER_PLAY_PILE)]
+        for goal in range(1, 13)]
+
+def goal_distance(hg, player_id):
+    '''
+        Return a lower bound on the number of moves player_id needs to play their goal card this turn
+        (counting playing it), or None if they certainly can't
+        Every card in their hand and discard piles is assumed to be playable, so it's enough for
+        one play pile to have a card or a wild for each value between its length and the goal card
+    '''
+    goal = canonical_value(hg.goal_cards[player_id])
+    if goal == 0:
+        return None
+    if goal == 13:
+        return 1
+    # bit n is set if a card with canonical value n is available
+    available = 0
+    num_wilds = 0
+    for pile in (hg.player_hands[player_id],) + tuple(hg.discard_piles[player_id]):
+        for card in pile:
+            if card.canonical == 13:
+                num_wilds += 1
+            else:
+                available |= 1 << card.canonical
+    best = None
+    for pile in hg.play_piles:
+        required = REQUIRED_VALUES[goal][len(pile)]
+        if bin(required & ~available).count('1') <= num_wilds:
+            distance = bin(required).count('1') + 1
+            if best is None or distance < best:
+                best = distance
+    return best
+
+class ReachabilityOracle:
+    '''
+        Answers whether a player can play their goal card on their turn, using only their discard piles
+        and some number of wild cards assumed to be in their hand
+        That only depends on the goal card, discard piles, play pile lengths and number of wilds, so
+        the answer is cached on those (with the piles sorted, since their order doesn't matter)
+        The cache is an LRU cache which lives as long as the oracle, so it's kept between moves
+    '''
+    def __init__(self, maxsize=DEFAULT_CACHE_SIZE):
+        self.reachable = functools.lru_cache(maxsize=maxsize)(self._reachable)
+
+    def can_play_goal(self, hg, player_id, num_wilds):
+        '''
+            Check if player_id could play their goal card if it were their turn and they had
+            num_wilds wild cards in their hand
+        '''
+        return self.wilds_needed(hg, player_id, num_wilds) is not None
+
+    def wilds_needed(self, hg, player_id, max_wilds):
+        '''
+            Return the fewest wild cards (up to max_wilds) player_id needs in their hand to play
+            their goal card on their turn, or None if max_wilds isn't enough
+        '''
+        goal = canonical_value(hg.goal_cards[player_id])
+        if goal == 0:
+            return None
+        # kings and jokers are the same as far as playing goes
+        discard_piles = tuple(sorted(
+                tuple(canonical_value(card) for card in pile) for pile in hg.discard_piles[player_id]
+            ))
+        play_lengths = tuple(sorted(len(pile) for pile in hg.play_piles))
+        for num_wilds in range(max_wilds + 1):
+            if self.reachable(goal, discard_piles, play_lengths, num_wilds):
+                return num_wilds
+        return None
+
+    def _reachable(self, goal, discard_piles, play_lengths, num_wilds):
+        '''
+            Every play uses up a card, so there are no cycles and each state can be cached on its own
+        '''
+        if goal == 13 or goal - 1 in play_lengths:
+            return True
+
+        for i, length in enumerate(play_lengths):
+            # piles of the same length are interchangeable
+            if i > 0 and length == play_lengths[i - 1]:
+                continue
+            new_length = length + 1
+            if new_length == MAX_CARDS_PER_PLAY_PILE:
+                new_length = 0
+            new_play_lengths = tuple(sorted(play_lengths[:i] + (new_length,) + play_lengths[i + 1:]))
+
+            if num_wilds > 0 and self.reachable(goal, discard_piles, new_play_lengths, num_wilds - 1):
+                return True
+
+            for j, pile in enumerate(discard_piles):
+                if len(pile) == 0 or (j > 0 and pile == discard_piles[j - 1]):
+                    continue
+                if pile[-1] != 13 and pile[-1] != length + 1:
+                    continue
+                new_discard_piles = tuple(sorted(discard_piles[:j] + (pile[:-1],) + discard_piles[j + 1:]))
+                if self.reachable(goal, new_discard_piles, new_play_lengths, num_wilds):
+                    return True
+
+        return False
+
+    def get_stats(self):
+        info = self.reachable.cache_info()
+        return {'oracle_hits': info.hits, 'oracle_misses': info.misses}
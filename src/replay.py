@@ -0,0 +1,50 @@
+'''
+    Rebuilding the state of a game at any move, from its seed and moves
+'''
+import bisect
+
+from game import Game
+
+# moves between checkpoints
+DEFAULT_CHECKPOINT_INTERVAL = 50
+
+class Replay:
+    '''
+        A game which can be seeked to any move, like a video
+        States are rebuilt by replaying moves from the nearest checkpoint before them, and checkpoints
+        are saved every checkpoint_interval moves as the game is replayed, so seeking around a long
+        game doesn't keep replaying it from the start
+    '''
+    def __init__(self, moves, seed, checkpoint_interval=DEFAULT_CHECKPOINT_INTERVAL, **game_args):
+        '''
+            moves are the Moves played in the game, and seed and game_args are what it was made with
+        '''
+        self.moves = moves
+        self.checkpoint_interval = checkpoint_interval
+        # checkpoints[i] is the game after checkpoint_moves[i] moves
+        self.checkpoint_moves = [0]
+        self.checkpoints = [Game(seed=seed, **game_args)]
+
+    def __len__(self):
+        return len(self.moves)
+
+    def get_state(self, move_index):
+        '''
+            Return a new Game as it was after move_index moves
+        '''
+        if move_index < 0 or move_index > len(self.moves):
+            raise RuntimeError("The game only has {} moves".format(len(self.moves)))
+        i = bisect.bisect_right(self.checkpoint_moves, move_index) - 1
+        num_moves = self.checkpoint_moves[i]
+        # checkpoints are kept untouched, so replay a fork with its own random numbers
+        game = self.checkpoints[i].fork()
+        while num_moves < move_index:
+            game.apply(self.moves[num_moves])
+            num_moves += 1
+            if num_moves % self.checkpoint_interval == 0 and num_moves > self.checkpoint_moves[-1]:
+                self.checkpoint_moves.append(num_moves)
+                self.checkpoints.append(game.fork())
+        return game
+
+    def get_final_state(self):
+        return self.get_state(len(self.moves))
@@ -0,0 +1,239 @@
+'''
+    Instrumentation for agent searches, and profiling of slow moves
+'''
+import cProfile, pstats, io, signal, math
+from collections import Counter
+
+class SearchStats:
+    '''
+        Counters an agent reports into while choosing one move
+        add() is for totals (e.g. nodes expanded), peak() is for maximums (e.g. largest seen set)
+    '''
+    def __init__(self):
+        self.counters = {}
+
+    def add(self, name, amount=1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def peak(self, name, value):
+        if value > self.counters.get(name, 0):
+            self.counters[name] = value
+
+class NullStats:
+    '''
+        Stats which are thrown away, for when nobody is collecting them
+    '''
+    def add(self, name, amount=1):
+        pass
+
+    def peak(self, name, value):
+        pass
+
+NULL_STATS = NullStats()
+
+# relative error of QuantileSketch's quantiles
+DEFAULT_SKETCH_ACCURACY = 0.01
+# values at or below this go in the sketch's zero bucket
+SKETCH_MIN_VALUE = 1e-9
+
+class QuantileSketch:
+    '''
+        Approximate quantiles of positive values in constant memory
+        Values are counted in buckets whose bounds grow by a factor of gamma, so any quantile is within
+        accuracy (relative) of the true one, and two sketches merge by adding their counts
+        Move times from a microsecond to an hour fit in about 1100 buckets at 1% accuracy
+    '''
+    def __init__(self, accuracy=DEFAULT_SKETCH_ACCURACY):
+        self.accuracy = accuracy
+        self.gamma = (1 + accuracy) / (1 - accuracy)
+        self.log_gamma = math.log(self.gamma)
+        # bucket index -> count, where bucket i holds values in (gamma^(i-1), gamma^i]
+        self.buckets = {}
+        self.zero_count = 0
+        self.count = 0
+
+    def add(self, value):
+        self.count += 1
+        if value <= SKETCH_MIN_VALUE:
+            self.zero_count += 1
+            return
+        i = math.ceil(math.log(value) / self.log_gamma)
+        self.buckets[i] = self.buckets.get(i, 0) + 1
+
+    def merge(self, other):
+        if other.accuracy != self.accuracy:
+            raise RuntimeError("Can't merge sketches with different accuracies")
+        for i, count in other.buckets.items():
+            self.buckets[i] = self.buckets.get(i, 0) + count
+        self.zero_count += other.zero_count
+        self.count += other.count
+
+    def quantile(self, q):
+        '''
+            Return the value q (0 to 1) of the way through the values, or None if there are none
+        '''
+        if self.count == 0:
+            return None
+        rank = q * (self.count - 1)
+        seen = self.zero_count
+        if rank < seen:
+            return 0
+        for i in sorted(self.buckets):
+            seen += self.buckets[i]
+            if rank < seen:
+                # the middle of the bucket, in relative terms
+                return 2 * self.gamma ** i / (self.gamma + 1)
+        return 2 * self.gamma ** max(self.buckets) / (self.gamma + 1)
+
+    def to_dict(self):
+        # JSON keys have to be strings
+        return {'accuracy': self.accuracy, 'zero_count': self.zero_count,
+                'buckets': {str(i): count for i, count in self.buckets.items()}}
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(data['accuracy'])
+        sketch.zero_count = data['zero_count']
+        sketch.buckets = {int(i): count for i, count in data['buckets'].items()}
+        sketch.count = sketch.zero_count + sum(sketch.buckets.values())
+        return sketch
+
+class StreamingStats:
+    '''
+        Count, mean, variance, min, max and approximate quantiles of a stream of values (e.g. move times),
+        without keeping the values
+        Stats from different games or worker processes can be merged, and the result is the same
+        (up to rounding) as if all the values had been added to one StreamingStats
+    '''
+    def __init__(self, accuracy=DEFAULT_SKETCH_ACCURACY):
+        self.count = 0
+        self.mean = 0
+        # sum of squared differences from the mean (Welford's algorithm)
+        self.m2 = 0
+        self.min = None
+        self.max = None
+        self.sketch = QuantileSketch(accuracy)
+
+    def add(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+        self.sketch.add(value)
+
+    def merge(self, other):
+        if other.count == 0:
+            return
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.m2 += other.m2 + delta * delta * self.count * other.count / count
+        self.mean += delta * other.count / count
+        self.count = count
+        self.min = other.min if self.min is None else min(self.min, other.min)
+        self.max = other.max if self.max is None else max(self.max, other.max)
+        self.sketch.merge(other.sketch)
+
+    @property
+    def total(self):
+        return self.mean * self.count
+
+    @property
+    def variance(self):
+        return self.m2 / (self.count - 1) if self.count > 1 else 0
+
+    def quantile(self, q):
+        '''
+            Return an approximate quantile, clamped to the exact min and max
+        '''
+        value = self.sketch.quantile(q)
+        if value is None:
+            return None
+        if q >= 1:
+            return self.max
+        return min(max(value, self.min), self.max)
+
+    def summary(self):
+        '''
+            Return the stats as something that can be stored as JSON
+        '''
+        return {
+                'count': self.count,
+                'mean': self.mean,
+                'stdev': math.sqrt(self.variance),
+                'min': self.min,
+                'max': self.max,
+                'p50': self.quantile(0.5),
+                'p95': self.quantile(0.95),
+                'p99': self.quantile(0.99),
+                }
+
+    def to_dict(self):
+        return {'count': self.count, 'mean': self.mean, 'm2': self.m2, 'min': self.min, 'max': self.max,
+                'sketch': self.sketch.to_dict()}
+
+    @classmethod
+    def from_dict(cls, data):
+        stats = cls()
+        stats.count = data['count']
+        stats.mean = data['mean']
+        stats.m2 = data['m2']
+        stats.min = data['min']
+        stats.max = data['max']
+        stats.sketch = QuantileSketch.from_dict(data['sketch'])
+        return stats
+
+class SlowMoveProfiler:
+    '''
+        Profiles every move, but only keeps the report for moves slower than threshold seconds
+        mode is 'cprofile' (exact, but slows everything down) or 'sampling' (samples the stack
+        every interval seconds with a profiling timer signal - much cheaper, Unix only)
+    '''
+    def __init__(self, threshold, mode='sampling', interval=0.001):
+        if mode not in ('cprofile', 'sampling'):
+            raise RuntimeError("Unknown profiler mode {}".format(mode))
+        self.threshold = threshold
+        self.mode = mode
+        self.interval = interval
+        self.profile = None
+        self.samples = None
+
+    def start(self):
+        if self.mode == 'cprofile':
+            self.profile = cProfile.Profile()
+            self.profile.enable()
+        else:
+            self.samples = Counter()
+            signal.signal(signal.SIGPROF, self._sample)
+            signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+
+    def _sample(self, signum, frame):
+        stack = []
+        while frame is not None:
+            stack.append('{}:{}'.format(frame.f_code.co_filename.split('/')[-1], frame.f_code.co_name))
+            frame = frame.f_back
+        stack.reverse()
+        self.samples[';'.join(stack)] += 1
+
+    def stop(self, elapsed):
+        '''
+            Stop profiling the move
+            Return a text report if the move took at least threshold seconds, otherwise None
+        '''
+        if self.mode == 'cprofile':
+            self.profile.disable()
+            if elapsed < self.threshold:
+                return None
+            out = io.StringIO()
+            pstats.Stats(self.profile, stream=out).sort_stats('cumulative').print_stats(30)
+            return out.getvalue()
+
+        signal.setitimer(signal.ITIMER_PROF, 0, 0)
+        signal.signal(signal.SIGPROF, signal.SIG_DFL)
+        if elapsed < self.threshold:
+            return None
+        # collapsed stacks, as used by flame graph tools
+        return '\n'.join('{} {}'.format(stack, count) for stack, count in self.samples.most_common())
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+'''
+    Headless self-play for generating lots of games quickly
+    Unlike GameRunner there's no output, no timing of moves and no new Game or HiddenGame every move:
+    the game is changed in place, one view is kept in step with it, and agents are reused between games
+'''
+import random, argparse, time
+from multiprocessing import Pool
+
+from game import Game
+from hiddengame import HiddenGame
+from compactgame import CompactGame
+from basicagent import BasicAgent
+from randomagent import RandomAgent
+from move import MOVE_END_TURN
+from beliefs import notify_agents
+
+AGENT_TYPES = [BasicAgent, RandomAgent]
+
+def play_headless(game, agents, view_type=HiddenGame):
+    '''
+        Play game until it's over, changing it in place
+        HiddenGame views are reused for the whole game, other view types are made every move
+        Return (winner, number of turns, number of moves) - winner is None for a stalemate
+    '''
+    for agent in agents:
+        agent.new_game()
+    reuse_view = view_type is HiddenGame
+    if reuse_view:
+        view = HiddenGame(game).copy_mutable()
+    num_turns = 1
+    num_moves = 0
+
+    while True:
+        if game.is_stalemate():
+            return (None, num_turns, num_moves)
+
+        if not reuse_view:
+            view = view_type(game)
+        move = agents[game.current_player].get_move(view)
+        notify_agents(agents, game.apply(move))
+        num_moves += 1
+        if move.type == MOVE_END_TURN:
+            num_turns += 1
+        if game.winner is not None:
+            return (game.winner, num_turns, num_moves)
+        if reuse_view:
+            view.follow(game, move)
+
+def play_games(args):
+    '''
+        Play a batch of games in one process, dealing game i (and seeding the random module) from seed + i
+        Return (wins per agent, stalemates, turns, moves) totalled over the batch
+    '''
+    seeds, compact, agent_args = args
+    agents = [agent(**agent_args) for agent in AGENT_TYPES]
+    view_type = CompactGame if compact else HiddenGame
+    wins = [0 for _ in agents]
+    num_stalemates = 0
+    total_turns = 0
+    total_moves = 0
+    for seed in seeds:
+        random.seed(seed)
+        winner, num_turns, num_moves = play_headless(Game(goal_size=10, seed=seed), agents, view_type)
+        if winner is None:
+            num_stalemates += 1
+        else:
+            wins[winner] += 1
+        total_turns += num_turns
+        total_moves += num_moves
+    return (wins, num_stalemates, total_turns, total_moves)
+
+def main():
+    parser = argparse.ArgumentParser(description="Play lots of games with no output, and report the throughput")
+    parser.add_argument('-n', '--num-games', type=int, default=100, dest='num_games', help='number of games')
+    parser.add_argument('-w', '--workers', type=int, default=1, help='number of processes to play games in')
+    parser.add_argument('-s', '--seed', type=int, default=None,
+            help='game i is played with seed + i, so runs with the same seed have the same results')
+    parser.add_argument('--compact', action='store_true', help='show agents the game as a CompactGame')
+    parser.add_argument('--max-move-ms', type=float, default=None, dest='max_move_ms',
+            help='time budget for each move in ms (default and 0 mean no limit)')
+    parser.add_argument('--max-nodes', type=int, default=None, dest='max_nodes',
+            help='limit on states expanded for each move')
+    parser.add_argument('--batch-size', type=int, default=100, dest='batch_size',
+            help='number of games given to a worker at once')
+    args = parser.parse_args()
+    agent_args = {'max_move_ms': args.max_move_ms or None, 'max_nodes': args.max_nodes}
+
+    seed = args.seed
+    if seed is None:
+        seed = random.SystemRandom().randrange(2**32)
+    seeds = list(range(seed, seed + args.num_games))
+    batches = [(seeds[i:i + args.batch_size], args.compact, agent_args)
+            for i in range(0, len(seeds), args.batch_size)]
+
+    wins = [0 for _ in AGENT_TYPES]
+    num_stalemates = 0
+    total_turns = 0
+    total_moves = 0
+
+    start_time = time.perf_counter()
+    if args.workers > 1:
+        pool = Pool(args.workers)
+        results = pool.imap_unordered(play_games, batches)
+    else:
+        pool = None
+        results = map(play_games, batches)
+    for batch_wins, batch_stalemates, batch_turns, batch_moves in results:
+        wins = [a + b for a, b in zip(wins, batch_wins)]
+        num_stalemates += batch_stalemates
+        total_turns += batch_turns
+        total_moves += batch_moves
+    elapsed = time.perf_counter() - start_time
+    if pool is not None:
+        pool.close()
+        pool.join()
+
+    print('Played {} games in {:.2f}s (seed {})'.format(args.num_games, elapsed, seed))
+    print('  games/second: {:.1f}'.format(args.num_games / elapsed))
+    print('  moves/second: {:.1f}'.format(total_moves / elapsed))
+    print('  avg turns per game: {:.1f}'.format(total_turns / args.num_games))
+    for agent_type, agent_wins in zip(AGENT_TYPES, wins):
+        print('  {}: {}'.format(agent_type.__name__, agent_wins))
+    print('  stalemates: {}'.format(num_stalemates))
+
+if __name__=='__main__':
+    main()
@@ -0,0 +1,39 @@
+'''
+    Transposition table shared by the searches done while choosing a move
+'''
+
+class TranspositionTable:
+    '''
+        Maps (tag, state key) to a stored result
+        The tag identifies the kind of search, since e.g. a state that can't reach a goal
+        card might still be able to empty the hand
+        Keys are HiddenGame.state_key()s, and the table is cleared at the start of every move so it
+        doesn't grow without limit
+    '''
+    def __init__(self):
+        self.table = {}
+        self.hits = 0
+        self.misses = 0
+
+    def clear(self):
+        '''
+            Forget all stored results, but keep counting hits and misses
+        '''
+        self.table = {}
+
+    def lookup(self, tag, key):
+        '''
+            Return the stored result, or None if there isn't one
+        '''
+        result = self.table.get((tag, key))
+        if result is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return result
+
+    def store(self, tag, key, result):
+        self.table[(tag, key)] = result
+
+    def __len__(self):
+        return len(self.table)
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+'''
+    Tunes BasicAgent's heuristic weights (see basicagent.DEFAULT_WEIGHTS) with SPSA
+
+    Each iteration perturbs every weight at once, in a random direction, both ways, and plays both
+    perturbed agents against a fixed opponent on the same deals with the seats swapped (common
+    random numbers), so the difference in their scores is mostly down to the weights. The weights
+    then move along that difference. Every few iterations the current weights are played on a fixed
+    set of validation deals, and the best so far are written to a weights file for BasicAgent(weights=...)
+'''
+import random, argparse, json, time
+from multiprocessing import Pool
+
+from game import Game
+from basicagent import BasicAgent, DEFAULT_WEIGHTS, load_weights
+from selfplay import play_headless
+
+# (weight, lowest, highest, perturbation size) - weights are tuned in units of their perturbation size
+TUNED_WEIGHTS = [
+        ('max_danger', 1, 5, 1),
+        ('gap_factor', 0, 1, 0.15),
+        ('hand_weight', 0.05, 4, 0.3),
+        ('danger_weight', 0.05, 4, 0.3),
+        ('goal_pile_weight', 0, 2, 0.3),
+        ]
+# standard SPSA gain sequence exponents
+ALPHA = 0.602
+GAMMA = 0.101
+DEFAULT_GOAL_SIZE = 10
+
+# the opponent made in this worker process, and the weights it was made with
+worker_opponent = None
+
+def to_vector(weights):
+    return [weights[name] / size for name, _, _, size in TUNED_WEIGHTS]
+
+def to_weights(vector):
+    '''
+        Turn a vector back into weights, keeping each weight within its bounds
+    '''
+    weights = dict(DEFAULT_WEIGHTS)
+    for x, (name, low, high, size) in zip(vector, TUNED_WEIGHTS):
+        weights[name] = min(max(x * size, low), high)
+    return weights
+
+def play_tuning_game(args):
+    '''
+        Run in a worker process: play one game between an agent with weights and the opponent,
+        with the agent in seat
+        Return the agent's score: 1 for a win, 0.5 for a stalemate and 0 for a loss
+    '''
+    global worker_opponent
+    weights, opponent_weights, seed, seat, agent_args = args
+    if worker_opponent is None or worker_opponent.weights != opponent_weights:
+        worker_opponent = BasicAgent(weights=opponent_weights, **agent_args)
+    agents = [worker_opponent, worker_opponent]
+    agents[seat] = BasicAgent(weights=weights, **agent_args)
+    random.seed(seed)
+    winner, _, _ = play_headless(Game(goal_size=DEFAULT_GOAL_SIZE, seed=seed), agents)
+    if winner is None:
+        return 0.5
+    return 1 if winner == seat else 0
+
+class Tuner:
+    '''
+        Plays batches of games for candidate weights, in a pool of worker processes if workers > 1
+    '''
+    def __init__(self, opponent_weights, agent_args, workers=1):
+        self.opponent_weights = opponent_weights
+        self.agent_args = agent_args
+        self.workers = workers
+        self.pool = Pool(workers) if workers > 1 else None
+        self.num_games = 0
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+
+    def evaluate(self, candidates, seeds):
+        '''
+            Return the average score of each set of weights in candidates, playing every deal in
+            seeds from both seats
+            All the games are sent to the workers at once, so the candidates are played in parallel
+        '''
+        tasks = [(weights, self.opponent_weights, seed, seat, self.agent_args)
+                for weights in candidates for seed in seeds for seat in range(2)]
+        if self.pool is not None:
+            scores = self.pool.map(play_tuning_game, tasks, chunksize=max(1, len(tasks) // (self.workers * 4)))
+        else:
+            scores = list(map(play_tuning_game, tasks))
+        self.num_games += len(tasks)
+        games_each = len(seeds) * 2
+        return [sum(scores[i * games_each:(i + 1) * games_each]) / games_each for i in range(len(candidates))]
+
+def save_weights(path, weights, score, iteration, num_games):
+    with open(path, 'w') as f:
+        json.dump({'weights': weights, 'score': score, 'iteration': iteration, 'games': num_games}, f, indent=1)
+
+def main():
+    parser = argparse.ArgumentParser(description="Tune BasicAgent's heuristic weights with SPSA and self-play")
+    parser.add_argument('output', help='weights file to write the best weights to')
+    parser.add_argument('-i', '--iterations', type=int, default=50, help='number of SPSA iterations')
+    parser.add_argument('-g', '--games', type=int, default=50,
+            help='deals for each perturbed agent per iteration (each is played from both seats)')
+    parser.add_argument('--validation-games', type=int, default=200, dest='validation_games',
+            help='deals the current weights are checked on (each is played from both seats)')
+    parser.add_argument('--eval-every', type=int, default=5, dest='eval_every',
+            help='check the current weights every this many iterations')
+    parser.add_argument('--start', metavar='FILE', help='weights file to start from (default: the default weights)')
+    parser.add_argument('--opponent', metavar='FILE', help='weights file for the opponent (default: the default weights)')
+    parser.add_argument('-a', type=float, default=4, help='SPSA step size')
+    parser.add_argument('-c', type=float, default=1, help='SPSA perturbation size, in units of each weight\'s perturbation size')
+    parser.add_argument('-w', '--workers', type=int, default=1, help='number of processes to play games in')
+    parser.add_argument('-s', '--seed', type=int, default=None,
+            help='seed for the deals and perturbations, so runs with the same seed have the same results')
+    parser.add_argument('--max-nodes', type=int, default=500, dest='max_nodes',
+            help='limit on states expanded for each move - keeps games fast and reproducible')
+    args = parser.parse_args()
+
+    seed = args.seed
+    if seed is None:
+        seed = random.SystemRandom().randrange(2**32)
+    rng = random.Random(seed)
+    agent_args = {'max_move_ms': None, 'max_nodes': args.max_nodes}
+    opponent_weights = load_weights(args.opponent) if args.opponent is not None else dict(DEFAULT_WEIGHTS)
+    vector = to_vector(load_weights(args.start) if args.start is not None else DEFAULT_WEIGHTS)
+    # the same validation deals every time, and new deals for each iteration
+    validation_seeds = list(range(seed, seed + args.validation_games))
+    next_seed = seed + args.validation_games
+
+    tuner = Tuner(opponent_weights, agent_args, args.workers)
+    start_time = time.perf_counter()
+    best_weights = to_weights(vector)
+    best_score = tuner.evaluate([best_weights], validation_seeds)[0]
+    save_weights(args.output, best_weights, best_score, 0, tuner.num_games)
+    print('Starting weights score {:.3f} (seed {})'.format(best_score, seed))
+
+    for k in range(args.iterations):
+        a_k = args.a / (k + 1 + args.iterations / 10) ** ALPHA
+        c_k = args.c / (k + 1) ** GAMMA
+        delta = [rng.choice((-1, 1)) for _ in vector]
+        plus = to_weights([x + c_k * d for x, d in zip(vector, delta)])
+        minus = to_weights([x - c_k * d for x, d in zip(vector, delta)])
+        seeds = list(range(next_seed, next_seed + args.games))
+        next_seed += args.games
+        score_plus, score_minus = tuner.evaluate([plus, minus], seeds)
+        # weights are clipped to their bounds, so the vector is too
+        vector = to_vector(to_weights([x + a_k * (score_plus - score_minus) / (2 * c_k * d)
+                for x, d in zip(vector, delta)]))
+        print('Iteration {}: {:.3f} vs {:.3f}'.format(k + 1, score_plus, score_minus), flush=True)
+
+        if (k + 1) % args.eval_every == 0 or k + 1 == args.iterations:
+            weights = to_weights(vector)
+            score = tuner.evaluate([weights], validation_seeds)[0]
+            print('  validation score {:.3f} (best {:.3f}): {}'.format(score, best_score,
+                ', '.join('{}={:.3f}'.format(name, weights[name]) for name, _, _, _ in TUNED_WEIGHTS)))
+            if score > best_score:
+                best_weights, best_score = weights, score
+                save_weights(args.output, best_weights, best_score, k + 1, tuner.num_games)
+
+    tuner.close()
+    print('Played {} games in {:.1f}s'.format(tuner.num_games, time.perf_counter() - start_time))
+    print('Best validation score {:.3f}, written to {}'.format(best_score, args.output))
+
+if __name__=='__main__':
+    main()